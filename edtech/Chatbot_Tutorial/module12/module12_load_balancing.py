@@ -4,8 +4,10 @@ Module 12: Performance Optimization - Load Balancing
 This module demonstrates how to implement basic load balancing for chatbots:
 1. Round-robin load balancing across multiple endpoints
 2. Weighted load balancing based on endpoint performance
+   (and a power-of-two-choices variant)
 3. Failure detection and automatic failover
 4. Performance monitoring for load-balanced systems
+5. Batched asynchronous dispatch over a shared connection
 
 Load balancing improves reliability and throughput by distributing requests
 across multiple instances or services.
@@ -15,8 +17,14 @@ import os
 import time
 import json
 import random
-import statistics
+import bisect
+import asyncio
+import itertools
+from array import array
 from collections import deque
+from dataclasses import dataclass
+import numpy as np
+import aiohttp
 import requests
 from dotenv import load_dotenv
 
@@ -28,79 +36,285 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY environment variable. Please set it in your .env file.")
 
+# Below this many endpoints itertools.accumulate builds the cumulative
+# weights faster than numpy's per-call overhead allows
+CUMSUM_NUMPY_THRESHOLD = 64
+
+# Endpoint state kept as a structure of arrays: the selection hot path only
+# touches the contiguous weight/status/latency arrays, while descriptive
+# metadata lives in separate "cold" lists
+@dataclass
+class EndpointPool:
+    """Parallel-array storage for load balanced endpoints"""
+    
+    names: list
+    models: list
+    window: int = 10  # Number of response times kept per endpoint
+    cooldown: float = 30.0  # Seconds before a failed endpoint is retried
+    
+    def __post_init__(self):
+        n = len(self.names)
+        # Hot-path state
+        self.weights = array("d", [1.0] * n)
+        self.statuses = bytearray([1] * n)  # 1 = healthy, 0 = unhealthy
+        self.sums = array("d", [0.0] * n)   # Rolling sum of response times
+        self.counts = array("I", [0] * n)   # Number of samples in the window
+        # Cold state, only needed to evict old samples from the rolling sum
+        self.response_times = [deque(maxlen=self.window) for _ in range(n)]
+        # Zero-copy numpy views over the arrays above for vectorized updates
+        self._weights_np = np.frombuffer(self.weights, dtype=np.float64)
+        self._statuses_np = np.frombuffer(self.statuses, dtype=np.uint8)
+        self._sums_np = np.frombuffer(self.sums, dtype=np.float64)
+        self._counts_np = np.frombuffer(self.counts, dtype=np.uintc)
+        # Indices of healthy endpoints and the sum of all weights
+        self.healthy = set(range(n))
+        self.total_weight = float(n)
+        # Monotonic time at which each unhealthy endpoint comes back
+        self.unhealthy_until = {}
+        # Cumulative weights for bisect; None means it needs rebuilding
+        self._cum = None
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def avg_time(self, index):
+        """Average response time of an endpoint, or 0 with no samples"""
+        count = self.counts[index]
+        return self.sums[index] / count if count else 0.0
+    
+    def is_healthy(self, index):
+        return self.statuses[index] == 1
+    
+    def _refresh_weight(self, index):
+        """Recompute one endpoint's weight and adjust the running total"""
+        avg_time = self.avg_time(index)
+        # Inverse relationship: faster endpoints get higher weights
+        weight = 1.0 / avg_time if avg_time > 0 else 1.0
+        # Unhealthy endpoints get no traffic
+        weight *= self.statuses[index]
+        self.total_weight += weight - self.weights[index]
+        self.weights[index] = weight
+        self._cum = None
+    
+    def update_weights(self):
+        """Recompute all weights from scratch"""
+        avg_times = np.divide(self._sums_np, self._counts_np,
+                              out=np.zeros(len(self)), where=self._counts_np > 0)
+        # Inverse relationship: faster endpoints get higher weights
+        self._weights_np.fill(1.0)
+        np.divide(1.0, avg_times, out=self._weights_np, where=avg_times > 0)
+        # Unhealthy endpoints get no traffic
+        self._weights_np *= self._statuses_np
+        self.total_weight = float(self._weights_np.sum())
+        self._cum = None
+    
+    def record_response_time(self, index, response_time):
+        """Add a response time sample to an endpoint's rolling window"""
+        samples = self.response_times[index]
+        if len(samples) == samples.maxlen:
+            self.sums[index] -= samples[0]
+        else:
+            self.counts[index] += 1
+        samples.append(response_time)
+        self.sums[index] += response_time
+        self._refresh_weight(index)
+    
+    def set_healthy(self, index, healthy):
+        """Mark an endpoint as healthy, or unhealthy for the cooldown period"""
+        if healthy:
+            self.unhealthy_until.pop(index, None)
+        else:
+            self.unhealthy_until[index] = time.monotonic() + self.cooldown
+        
+        if self.is_healthy(index) == healthy:
+            return
+        self.statuses[index] = 1 if healthy else 0
+        if healthy:
+            self.healthy.add(index)
+        else:
+            self.healthy.discard(index)
+        self._refresh_weight(index)
+    
+    def revive_expired(self):
+        """Mark endpoints healthy again once their cooldown has passed"""
+        if not self.unhealthy_until:
+            return
+        now = time.monotonic()
+        for index, until in list(self.unhealthy_until.items()):
+            if until <= now:
+                self.set_healthy(index, True)
+    
+    def reset_all(self):
+        """Mark every endpoint healthy again"""
+        for i in range(len(self)):
+            self.set_healthy(i, True)
+    
+    def cumulative_weights(self):
+        """Cumulative weights as a list, rebuilt only after something has changed"""
+        if self._cum is None:
+            if len(self) < CUMSUM_NUMPY_THRESHOLD:
+                self._cum = list(itertools.accumulate(self.weights))
+            else:
+                self._cum = np.cumsum(self._weights_np).tolist()
+            # Resync the running total to avoid floating point drift
+            self.total_weight = self._cum[-1]
+        return self._cum
+
 # Simulate multiple endpoints (in a real system, these would be different servers)
 # For demonstration, we'll use different models as our "endpoints"
-ENDPOINTS = [
-    {"name": "endpoint-1", "model": "llama3-8b-8192", "weight": 1.0, "status": "healthy", "response_times": deque(maxlen=10)},
-    {"name": "endpoint-2", "model": "gemma-7b-it", "weight": 1.0, "status": "healthy", "response_times": deque(maxlen=10)},
-    {"name": "endpoint-3", "model": "mixtral-8x7b-32768", "weight": 1.0, "status": "healthy", "response_times": deque(maxlen=10)}
+ENDPOINTS = EndpointPool(
+    names=["endpoint-1", "endpoint-2", "endpoint-3"],
+    models=["llama3-8b-8192", "gemma-7b-it", "mixtral-8x7b-32768"]
+)
+
+def print_endpoint_statistics():
+    """Print request count, average time and weight for every endpoint"""
+    for i in range(len(ENDPOINTS)):
+        name, model = ENDPOINTS.names[i], ENDPOINTS.models[i]
+        if ENDPOINTS.counts[i]:
+            print(f"- {name} ({model}): {ENDPOINTS.counts[i]} requests, avg time: {ENDPOINTS.avg_time(i):.2f}s, weight: {ENDPOINTS.weights[i]:.2f}")
+        else:
+            print(f"- {name} ({model}): No requests")
+
+# API endpoint
+API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Request headers, shared by every request
+REQUEST_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# Shared session so the headers are set once and connections are reused
+SESSION = requests.Session()
+SESSION.headers.update(REQUEST_HEADERS)
+
+# Request body templates, built once per endpoint; only the user message
+# changes between calls
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful AI assistant."}
+REQUEST_TEMPLATES = [
+    {
+        "model": model,
+        "messages": [SYSTEM_MESSAGE, None],
+        "temperature": 0.7,
+        "max_tokens": 150  # Smaller for faster responses in demo
+    }
+    for model in ENDPOINTS.models
 ]
 
+def build_request_body(prompt, endpoint_index):
+    """
+    Serialize the request body for an endpoint.
+    
+    Args:
+        prompt (str): The user's message
+        endpoint_index (int): Index of the endpoint to use
+        
+    Returns:
+        bytes: The JSON encoded request body
+    """
+    template = REQUEST_TEMPLATES[endpoint_index]
+    template["messages"][1] = {"role": "user", "content": prompt}
+    # Serialize straight away so the shared template can be reused
+    return json.dumps(template, separators=(",", ":")).encode("utf-8")
+
 # Basic chat function for a specific endpoint
-def chat_with_endpoint(prompt, endpoint_index):
+def chat_with_endpoint(prompt, endpoint_index, timeout=None):
     """
     Send a prompt to a specific endpoint.
     
     Args:
         prompt (str): The user's message
         endpoint_index (int): Index of the endpoint to use
+        timeout (float, optional): Request timeout in seconds
         
     Returns:
         dict: The response data including content and timing information
     """
-    endpoint = ENDPOINTS[endpoint_index]
-    model = endpoint["model"]
-    start_time = time.time()
-    
-    # API endpoint
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    
-    # Request headers
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Request body
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "You are a helpful AI assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 150  # Smaller for faster responses in demo
-    }
+    name = ENDPOINTS.names[endpoint_index]
+    model = ENDPOINTS.models[endpoint_index]
+    start_time = time.perf_counter()
+    body = build_request_body(prompt, endpoint_index)
     
     try:
         # Send request
-        response = requests.post(url, headers=headers, json=data)
+        response = SESSION.post(API_URL, data=body, timeout=timeout)
         response.raise_for_status()
         result = response.json()
         
         # Calculate time
-        end_time = time.time()
+        end_time = time.perf_counter()
         response_time = end_time - start_time
         
         # Update endpoint stats
-        endpoint["response_times"].append(response_time)
+        ENDPOINTS.record_response_time(endpoint_index, response_time)
         
         return {
             "content": result["choices"][0]["message"]["content"],
             "response_time": response_time,
-            "endpoint": endpoint["name"],
+            "endpoint": name,
             "model": model,
             "status": "success"
         }
         
     except requests.exceptions.RequestException as e:
         # Mark endpoint as unhealthy after failure
-        endpoint["status"] = "unhealthy"
+        ENDPOINTS.set_healthy(endpoint_index, False)
+        
+        return {
+            "content": f"Error: {str(e)}",
+            "response_time": time.perf_counter() - start_time,
+            "endpoint": name,
+            "model": model,
+            "status": "error"
+        }
+
+# Asynchronous chat function for a specific endpoint
+async def chat_with_endpoint_async(session, prompt, endpoint_index):
+    """
+    Send a prompt to a specific endpoint asynchronously.
+    
+    Args:
+        session (aiohttp.ClientSession): Shared aiohttp session
+        prompt (str): The user's message
+        endpoint_index (int): Index of the endpoint to use
+        
+    Returns:
+        dict: The response data including content and timing information
+    """
+    name = ENDPOINTS.names[endpoint_index]
+    model = ENDPOINTS.models[endpoint_index]
+    start_time = time.perf_counter()
+    body = build_request_body(prompt, endpoint_index)
+    
+    try:
+        # Send request asynchronously
+        async with session.post(API_URL, headers=REQUEST_HEADERS, data=body) as response:
+            response.raise_for_status()
+            result = await response.json()
+        
+        # Calculate time
+        response_time = time.perf_counter() - start_time
+        
+        # Update endpoint stats
+        ENDPOINTS.record_response_time(endpoint_index, response_time)
+        
+        return {
+            "content": result["choices"][0]["message"]["content"],
+            "response_time": response_time,
+            "endpoint": name,
+            "model": model,
+            "status": "success"
+        }
+        
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # Mark endpoint as unhealthy after failure
+        ENDPOINTS.set_healthy(endpoint_index, False)
         
         return {
             "content": f"Error: {str(e)}",
-            "response_time": time.time() - start_time,
-            "endpoint": endpoint["name"],
+            "response_time": time.perf_counter() - start_time,
+            "endpoint": name,
             "model": model,
             "status": "error"
         }
@@ -115,19 +329,20 @@ class RoundRobinLoadBalancer:
     
     def get_next_endpoint(self):
         """Get the next endpoint in rotation"""
+        self.endpoints.revive_expired()
+        
         # Find next healthy endpoint
         start_index = self.current_index
         while True:
-            endpoint = self.endpoints[self.current_index]
+            healthy = self.endpoints.is_healthy(self.current_index)
             self.current_index = (self.current_index + 1) % len(self.endpoints)
             
-            if endpoint["status"] == "healthy":
+            if healthy:
                 return self.current_index
             
             # If we've checked all endpoints and none are healthy, reset all to healthy and try again
             if self.current_index == start_index:
-                for ep in self.endpoints:
-                    ep["status"] = "healthy"
+                self.endpoints.reset_all()
                 return self.current_index
     
     def send_request(self, prompt):
@@ -139,153 +354,272 @@ class RoundRobinLoadBalancer:
 class WeightedLoadBalancer:
     """Load balancer that distributes traffic based on weights"""
     
-    def __init__(self, endpoints):
+    def __init__(self, endpoints, max_retries=2, backoff=0.1):
         self.endpoints = endpoints
+        self.max_retries = max_retries  # Extra attempts after the first failure
+        self.backoff = backoff  # Base delay in seconds between attempts
         self.update_weights()
     
     def update_weights(self):
         """Update weights based on endpoint performance"""
-        # Calculate average response time for each endpoint
-        for endpoint in self.endpoints:
-            if endpoint["response_times"]:
-                avg_time = statistics.mean(endpoint["response_times"])
-                # Inverse relationship: faster endpoints get higher weights
-                if avg_time > 0:
-                    endpoint["weight"] = 1.0 / avg_time
-                else:
-                    endpoint["weight"] = 1.0
-            else:
-                endpoint["weight"] = 1.0
-            
-            # Set weight to 0 for unhealthy endpoints
-            if endpoint["status"] != "healthy":
-                endpoint["weight"] = 0
+        self.endpoints.update_weights()
     
     def get_next_endpoint(self):
         """Get the next endpoint based on weights"""
-        self.update_weights()
-        
-        # Check if all endpoints are unhealthy
-        all_unhealthy = all(endpoint["status"] != "healthy" for endpoint in self.endpoints)
-        if all_unhealthy:
-            # Reset all endpoints to healthy
-            for endpoint in self.endpoints:
-                endpoint["status"] = "healthy"
-            self.update_weights()
-        
-        # Get total weight
-        total_weight = sum(endpoint["weight"] for endpoint in self.endpoints)
-        
-        if total_weight == 0:
-            # If all weights are 0, use round-robin
-            return random.randint(0, len(self.endpoints) - 1)
-        
-        # Choose endpoint based on weight
-        r = random.uniform(0, total_weight)
-        upto = 0
-        for i, endpoint in enumerate(self.endpoints):
-            if upto + endpoint["weight"] >= r:
-                return i
-            upto += endpoint["weight"]
-        
-        # Fallback
-        return 0
+        pool = self.endpoints
+        pool.revive_expired()
+        
+        # If all endpoints are unhealthy, reset them to healthy
+        if not pool.healthy:
+            pool.reset_all()
+        
+        if pool.total_weight <= 0:
+            # If all weights are 0, pick any endpoint at random
+            return random.randrange(len(pool))
+        
+        # Choose endpoint based on weight with a binary search; bisect on a
+        # plain list avoids numpy's per-call overhead for a single lookup.
+        # random.choices(cum_weights=...) does the same bisect internally but
+        # adds argument checks and list building on every call
+        cum = pool.cumulative_weights()
+        return bisect.bisect_right(cum, random.random() * cum[-1])
+    
+    def _fallback_iter(self, excluded):
+        """Yield healthy endpoints round-robin from a random start, skipping excluded ones"""
+        n = len(self.endpoints)
+        start = random.randrange(n)
+        for k in range(n):
+            index = (start + k) % n
+            if index in excluded or not self.endpoints.is_healthy(index):
+                continue
+            yield index
     
     def send_request(self, prompt):
-        """Send request to an endpoint based on weights"""
+        """Send request to an endpoint based on weights, failing over on errors"""
         endpoint_index = self.get_next_endpoint()
-        return chat_with_endpoint(prompt, endpoint_index)
+        excluded = set()
+        # Weighted sampling without the failed endpoints is close to uniform,
+        # so retries use a cheap round-robin scan instead of re-sampling
+        fallback = self._fallback_iter(excluded)
+        
+        for attempt in range(self.max_retries + 1):
+            response = chat_with_endpoint(prompt, endpoint_index)
+            if response["status"] == "success":
+                return response
+            
+            # The failed endpoint is now cooling down; try another one
+            excluded.add(endpoint_index)
+            if attempt == self.max_retries:
+                break
+            endpoint_index = next(fallback, None)
+            if endpoint_index is None:
+                break
+            
+            # Exponential backoff with jitter before the next attempt
+            time.sleep(self.backoff * 2 ** attempt * (1 + random.random() * 0.2))
+        
+        return response
 
 # Adaptive load balancer with health checks
-class AdaptiveLoadBalancer:
+class AdaptiveLoadBalancer(WeightedLoadBalancer):
     """Advanced load balancer with health checks and adaptive weights"""
     
-    def __init__(self, endpoints):
-        self.endpoints = endpoints
-        self.health_check_interval = 5  # seconds
+    def __init__(self, endpoints, *, health_check_interval=5.0, health_timeout=2.0,
+                 health_retries=2, jitter=0.2, min_interval=1.0, **kwargs):
+        """
+        Initialize the adaptive load balancer.
+        
+        Args:
+            endpoints (EndpointPool): The endpoints to balance across
+            health_check_interval (float): Seconds between health checks
+            health_timeout (float): Timeout in seconds for each health probe
+            health_retries (int): Extra probes before an endpoint stays unhealthy
+            jitter (float): Random +/- fraction applied to the interval so
+                probes from many balancers don't synchronize
+            min_interval (float): Smallest allowed health check interval
+            **kwargs: Retry settings passed on to WeightedLoadBalancer
+        """
+        if health_check_interval < min_interval:
+            raise ValueError(f"health_check_interval must be at least {min_interval} seconds")
+        if health_timeout <= 0:
+            raise ValueError("health_timeout must be positive")
+        if health_retries < 0:
+            raise ValueError("health_retries cannot be negative")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be between 0 and 1")
+        
+        self.health_check_interval = health_check_interval
+        self.health_timeout = health_timeout
+        self.health_retries = health_retries
+        self.jitter = jitter
         self.last_health_check = 0
-        self.update_weights()
-    
-    def update_weights(self):
-        """Update weights based on endpoint performance and health"""
-        # Calculate average response time for each endpoint
-        for endpoint in self.endpoints:
-            if endpoint["response_times"]:
-                avg_time = statistics.mean(endpoint["response_times"])
-                # Inverse relationship: faster endpoints get higher weights
-                if avg_time > 0:
-                    endpoint["weight"] = 1.0 / avg_time
-                else:
-                    endpoint["weight"] = 1.0
-            else:
-                endpoint["weight"] = 1.0
-            
-            # Set weight to 0 for unhealthy endpoints
-            if endpoint["status"] != "healthy":
-                endpoint["weight"] = 0
+        self.next_health_check = 0
+        super().__init__(endpoints, **kwargs)
+    
+    def _probe(self, endpoint_index):
+        """Probe an endpoint, retrying before giving up on it"""
+        for _ in range(self.health_retries + 1):
+            # Simple health check - just a quick API call
+            response = chat_with_endpoint("Hello", endpoint_index, timeout=self.health_timeout)
+            if response["status"] == "success":
+                return True
+        return False
     
     def health_check(self):
         """Perform health check on all endpoints"""
-        current_time = time.time()
+        current_time = time.monotonic()
         
         # Only run health check at intervals
-        if current_time - self.last_health_check < self.health_check_interval:
+        if current_time < self.next_health_check:
             return
         
         self.last_health_check = current_time
+        # Jitter the next check so probes don't line up across balancers
+        interval = self.health_check_interval * (1 + random.uniform(-self.jitter, self.jitter))
+        self.next_health_check = current_time + interval
         print("\nPerforming health check on all endpoints...")
         
-        for i, endpoint in enumerate(self.endpoints):
-            if endpoint["status"] != "healthy":
+        for i in range(len(self.endpoints)):
+            if not self.endpoints.is_healthy(i):
+                name = self.endpoints.names[i]
                 # Try to recover unhealthy endpoint
-                try:
-                    # Simple health check - just a quick API call
-                    response = chat_with_endpoint("Hello", i)
-                    if response["status"] == "success":
-                        print(f"Endpoint {endpoint['name']} recovered!")
-                        endpoint["status"] = "healthy"
-                except:
-                    print(f"Endpoint {endpoint['name']} still unhealthy")
+                if self._probe(i):
+                    print(f"Endpoint {name} recovered!")
+                    self.endpoints.set_healthy(i, True)
+                else:
+                    print(f"Endpoint {name} still unhealthy")
     
     def get_next_endpoint(self):
         """Get the next endpoint based on adaptive algorithm"""
         # Run health check
         self.health_check()
         
-        # Update weights
-        self.update_weights()
-        
-        # Check if all endpoints are unhealthy
-        all_unhealthy = all(endpoint["status"] != "healthy" for endpoint in self.endpoints)
-        if all_unhealthy:
-            # Reset all endpoints to healthy
-            for endpoint in self.endpoints:
-                endpoint["status"] = "healthy"
-            self.update_weights()
-        
-        # Get total weight
-        total_weight = sum(endpoint["weight"] for endpoint in self.endpoints)
-        
-        if total_weight == 0:
-            # If all weights are 0, use round-robin
-            return random.randint(0, len(self.endpoints) - 1)
-        
-        # Choose endpoint based on weight
-        r = random.uniform(0, total_weight)
-        upto = 0
-        for i, endpoint in enumerate(self.endpoints):
-            if upto + endpoint["weight"] >= r:
-                return i
-            upto += endpoint["weight"]
-        
-        # Fallback
-        return 0
+        return super().get_next_endpoint()
+
+# Power-of-two-choices load balancer
+class P2CLoadBalancer:
+    """
+    Load balancer using the "power of two random choices" policy.
+    
+    Two endpoints are sampled uniformly at random and the one with the lower
+    average response time wins. This needs no weights or cumulative sums and
+    still keeps the load close to optimally balanced.
+    """
+    
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+    
+    def _load(self, endpoint_index):
+        """Current load of an endpoint, measured as its rolling average response time"""
+        return self.endpoints.avg_time(endpoint_index)
+    
+    def get_next_endpoint(self):
+        """Pick the less loaded of two randomly sampled endpoints"""
+        pool = self.endpoints
+        pool.revive_expired()
+        
+        # If all endpoints are unhealthy, reset them to healthy
+        if not pool.healthy:
+            pool.reset_all()
+        
+        n = len(pool)
+        if n == 1:
+            return 0
+        
+        i, j = random.sample(range(n), 2)
+        # Resample once if either choice is unhealthy
+        if not (pool.is_healthy(i) and pool.is_healthy(j)):
+            i, j = random.sample(range(n), 2)
+        
+        candidates = [index for index in (i, j) if pool.is_healthy(index)]
+        if not candidates:
+            return random.choice(tuple(pool.healthy))
+        if len(candidates) == 1:
+            return candidates[0]
+        return i if self._load(i) <= self._load(j) else j
     
     def send_request(self, prompt):
-        """Send request using adaptive load balancing"""
+        """Send request to the less loaded of two random endpoints"""
         endpoint_index = self.get_next_endpoint()
         return chat_with_endpoint(prompt, endpoint_index)
 
+# Batched asynchronous dispatcher
+class BatchedDispatcher:
+    """
+    Queue prompts and dispatch them to load balanced endpoints in batches.
+    
+    Worker coroutines drain up to max_batch queued prompts at a time and send
+    them concurrently over one shared aiohttp session, so callers pay for
+    connection setup once instead of per prompt.
+    """
+    
+    def __init__(self, balancer, max_batch=8, num_workers=2):
+        self.balancer = balancer
+        self.max_batch = max_batch
+        self.num_workers = num_workers
+        self.queue = None
+        self.session = None
+        self.workers = []
+    
+    async def start(self):
+        """Open the shared session and start the worker coroutines"""
+        self.queue = asyncio.Queue()
+        self.session = aiohttp.ClientSession()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+    
+    async def close(self):
+        """Wait for queued prompts, then stop the workers and close the session"""
+        await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.session.close()
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def submit(self, prompt):
+        """Queue a prompt and wait for its response"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((prompt, future))
+        return await future
+    
+    async def send_request(self, prompt):
+        """Send request through the batching queue"""
+        return await self.submit(prompt)
+    
+    async def _worker(self):
+        """Pull batches off the queue and resolve their futures"""
+        while True:
+            # Block for the first prompt, then take whatever else is waiting
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            
+            try:
+                tasks = [
+                    chat_with_endpoint_async(self.session, prompt, self.balancer.get_next_endpoint())
+                    for prompt, _ in batch
+                ]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
 # Demonstration function
 def demonstrate_load_balancing():
     """Demonstrate different load balancing strategies"""
@@ -346,12 +680,7 @@ def demonstrate_load_balancing():
     
     # Endpoint statistics
     print("\nEndpoint Statistics:")
-    for endpoint in ENDPOINTS:
-        if endpoint["response_times"]:
-            avg_time = statistics.mean(endpoint["response_times"])
-            print(f"- {endpoint['name']} ({endpoint['model']}): {len(endpoint['response_times'])} requests, avg time: {avg_time:.2f}s, weight: {endpoint['weight']:.2f}")
-        else:
-            print(f"- {endpoint['name']} ({endpoint['model']}): No requests")
+    print_endpoint_statistics()
     
     # Distribution analysis
     rr_distribution = {}
@@ -404,8 +733,8 @@ def simulate_failure():
     print("\n\n2. SIMULATING FAILURE OF ENDPOINT-1")
     print("-" * 40)
     
-    ENDPOINTS[0]["status"] = "unhealthy"
-    print(f"Endpoint {ENDPOINTS[0]['name']} is now marked as unhealthy!")
+    ENDPOINTS.set_healthy(0, False)
+    print(f"Endpoint {ENDPOINTS.names[0]} is now marked as unhealthy!")
     
     # Process next 2 prompts with failure
     for i, prompt in enumerate(test_prompts[2:4]):
@@ -420,8 +749,8 @@ def simulate_failure():
     print("\n\n3. SIMULATING RECOVERY")
     print("-" * 40)
     
-    ENDPOINTS[0]["status"] = "healthy"
-    print(f"Endpoint {ENDPOINTS[0]['name']} is now recovered and marked as healthy!")
+    ENDPOINTS.set_healthy(0, True)
+    print(f"Endpoint {ENDPOINTS.names[0]} is now recovered and marked as healthy!")
     
     # Process last prompt after recovery
     print(f"\nPrompt 5: {test_prompts[4]}")
@@ -439,6 +768,40 @@ def simulate_failure():
     print("routed traffic to healthy endpoints. After recovery, the previously")
     print("failed endpoint was reintegrated into the rotation.")
 
+# Batched dispatch demo
+async def batched_dispatch_demo():
+    """Demonstrate sending prompts through the batched dispatcher"""
+    print("\n" + "="*80)
+    print("BATCHED ASYNCHRONOUS DISPATCH".center(80))
+    print("="*80)
+    
+    test_prompts = [
+        "What is request batching?",
+        "Explain queueing theory in one sentence.",
+        "What is a worker pool?",
+        "What is backpressure?",
+        "Define throughput.",
+        "Define latency."
+    ]
+    
+    weighted = WeightedLoadBalancer(ENDPOINTS)
+    start_time = time.perf_counter()
+    
+    async with BatchedDispatcher(weighted, max_batch=4) as dispatcher:
+        responses = await asyncio.gather(*(dispatcher.send_request(prompt) for prompt in test_prompts))
+    
+    total_time = time.perf_counter() - start_time
+    
+    for i, (prompt, response) in enumerate(zip(test_prompts, responses)):
+        print(f"\nPrompt {i+1}: {prompt}")
+        print(f"Endpoint: {response['endpoint']} ({response['model']})")
+        print(f"Response time: {response['response_time']:.2f} seconds")
+        print(f"Response: {response['content'][:100]}...")
+    
+    print(f"\nTotal time for {len(test_prompts)} prompts: {total_time:.2f} seconds")
+    print("\nEndpoint Statistics:")
+    print_endpoint_statistics()
+
 # Interactive demo
 def interactive_load_balancing_demo():
     """Interactive demo to test load balancing"""
@@ -450,6 +813,7 @@ def interactive_load_balancing_demo():
     round_robin = RoundRobinLoadBalancer(ENDPOINTS)
     weighted = WeightedLoadBalancer(ENDPOINTS)
     adaptive = AdaptiveLoadBalancer(ENDPOINTS)
+    p2c = P2CLoadBalancer(ENDPOINTS)
     
     while True:
         print("\nEnter a prompt to test load balancing (or 'exit' to quit):")
@@ -462,6 +826,7 @@ def interactive_load_balancing_demo():
         print("1. Round-Robin")
         print("2. Weighted")
         print("3. Adaptive with Health Checks")
+        print("4. Power of Two Choices")
         
         strategy = input("> ").strip()
         
@@ -474,6 +839,9 @@ def interactive_load_balancing_demo():
         elif strategy == "3":
             response = adaptive.send_request(prompt)
             strategy_name = "Adaptive"
+        elif strategy == "4":
+            response = p2c.send_request(prompt)
+            strategy_name = "Power of Two Choices"
         else:
             print("Invalid strategy. Using Round-Robin.")
             response = round_robin.send_request(prompt)
@@ -486,12 +854,7 @@ def interactive_load_balancing_demo():
         
         # Show endpoint statistics
         print("\nEndpoint Statistics:")
-        for endpoint in ENDPOINTS:
-            if endpoint["response_times"]:
-                avg_time = statistics.mean(endpoint["response_times"])
-                print(f"- {endpoint['name']} ({endpoint['model']}): {len(endpoint['response_times'])} requests, avg time: {avg_time:.2f}s, weight: {endpoint['weight']:.2f}")
-            else:
-                print(f"- {endpoint['name']} ({endpoint['model']}): No requests")
+        print_endpoint_statistics()
 
 if __name__ == "__main__":
     print("Module 12: Performance Optimization - Load Balancing")
@@ -502,7 +865,8 @@ if __name__ == "__main__":
         print("1. Demonstrate load balancing strategies")
         print("2. Simulate endpoint failure and recovery")
         print("3. Interactive load balancing demo")
-        print("4. Exit")
+        print("4. Batched asynchronous dispatch")
+        print("5. Exit")
         
         choice = input("> ").strip()
         
@@ -513,6 +877,8 @@ if __name__ == "__main__":
         elif choice == "3":
             interactive_load_balancing_demo()
         elif choice == "4":
+            asyncio.run(batched_dispatch_demo())
+        elif choice == "5":
             break
         else:
             print("Invalid choice. Please try again.")
@@ -4,6 +4,7 @@ Module 12: Performance Optimization - Streaming Responses
 This module demonstrates how to implement streaming responses for chatbots:
 1. Basic streaming implementation with Groq API
 2. Token-by-token display in the terminal
+   (stream_chat() yields each token as it arrives)
 3. Performance comparison between streaming and non-streaming
 
 Streaming responses improve perceived performance by showing results incrementally
@@ -11,12 +12,23 @@ as they're generated, rather than waiting for the complete response.
 """
 
 import os
+import re
+import gzip
 import time
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
 import sys
 from dotenv import load_dotenv
 
+# orjson parses each streamed chunk much faster; fall back to json if it's missing
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Load environment variables
 load_dotenv()
 
@@ -25,6 +37,162 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY environment variable. Please set it in your .env file.")
 
+# API endpoint
+API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Request headers, shared by every request
+REQUEST_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# System message, identical for every request
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful AI assistant."}
+
+# Shared session: keeps connections alive between calls and sends the
+# auth headers on every request
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+SESSION.headers.update(REQUEST_HEADERS)
+
+# Request bodies larger than this are sent gzip-compressed. Responses are
+# already compressed: requests advertises gzip in Accept-Encoding and the
+# raw stream readers below decode it
+GZIP_MIN_BODY_BYTES = 512
+
+# Whether the API accepts gzip-compressed bodies: None until the first
+# compressed request has shown it, then True or False for the rest of the run
+_gzip_requests = None
+
+# Statuses that say nothing about the body's encoding
+_ENCODING_NEUTRAL_STATUSES = {401, 403, 429}
+
+def post_chat_request(data, **kwargs):
+    """
+    Post a chat completion request through the shared session.
+    
+    Large bodies are gzip-compressed. The first compressed request doubles
+    as a probe: if the API rejects it with a client error (typically 415,
+    or 400 from servers that read the gzip bytes as invalid JSON), it is
+    resent uncompressed and compression stays off for the rest of the run;
+    otherwise compression stays on.
+    
+    Args:
+        data (dict): The request body
+        **kwargs: Extra arguments for requests, e.g. stream=True
+        
+    Returns:
+        requests.Response: The API response
+    """
+    global _gzip_requests
+    body = json.dumps(data).encode("utf-8")
+    
+    if _gzip_requests is not False and len(body) > GZIP_MIN_BODY_BYTES:
+        response = SESSION.post(API_URL, data=gzip.compress(body),
+                                headers={"Content-Encoding": "gzip"}, **kwargs)
+        if _gzip_requests:
+            return response
+        status = response.status_code
+        if status >= 500 or status in _ENCODING_NEUTRAL_STATUSES:
+            # Inconclusive; probe again with the next large request
+            return response
+        if status < 400:
+            _gzip_requests = True
+            return response
+        response.close()
+        _gzip_requests = False
+    
+    return SESSION.post(API_URL, data=body, **kwargs)
+
+class SSEParser:
+    """
+    Incremental parser for server-sent events read from a raw urllib3 response.
+    
+    Chunks are appended to one buffer and complete frames are sliced out with
+    a single find() for the blank line that ends each event, instead of
+    splitting and checking the stream line by line.
+    """
+    
+    def __init__(self, raw, chunk_size=8192):
+        """
+        Initialize the parser.
+        
+        Args:
+            raw (urllib3.response.HTTPResponse): The raw response stream
+            chunk_size (int): Maximum number of bytes to read at a time
+        """
+        self.raw = raw
+        self.chunk_size = chunk_size
+    
+    def _chunks(self):
+        """
+        Yield decoded chunks of the raw stream.
+        
+        Reading the raw stream bypasses requests, so urllib3 errors are
+        translated into the requests exceptions callers already handle.
+        """
+        try:
+            yield from self.raw.stream(self.chunk_size, decode_content=True)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+    
+    @staticmethod
+    def _parse_frame(frame):
+        """Split one frame into its event type and data, or None if it has no data"""
+        event_type = b"message"
+        data_lines = []
+        for line in frame.split(b"\n"):
+            if line.startswith(b"data:"):
+                data_lines.append(line[6:] if line.startswith(b"data: ") else line[5:])
+            elif line.startswith(b"event:"):
+                event_type = line[6:].strip()
+        if not data_lines:
+            return None
+        return event_type, b"\n".join(data_lines)
+    
+    def events(self):
+        """
+        Yield each event in the stream.
+        
+        Yields:
+            tuple: (event_type, data) as bytes
+            
+        Raises:
+            requests.exceptions.RequestException: If the connection fails
+                mid-stream, as iter_lines() would raise it
+        """
+        buffer = bytearray()
+        for chunk in self._chunks():
+            buffer += chunk.replace(b"\r", b"")
+            start = 0
+            while True:
+                end = buffer.find(b"\n\n", start)
+                if end == -1:
+                    break
+                event = self._parse_frame(bytes(buffer[start:end]))
+                start = end + 2
+                if event is not None:
+                    yield event
+            del buffer[:start]
+        
+        # A final frame may not be followed by a blank line
+        event = self._parse_frame(bytes(buffer))
+        if event is not None:
+            yield event
+
+# After the first token, streamed output is written in batches of up to
+# this many tokens, or whenever this much time has passed since the last write
+DISPLAY_BATCH_TOKENS = 8
+DISPLAY_BATCH_SECONDS = 0.02
+
+# Typing effect pieces: words, single punctuation marks/newlines, and runs of spaces
+TYPING_PIECE_PATTERN = re.compile(r"[^\s.,!?]+|[.,!?\n]|[^\S\n]+")
+TYPING_PAUSE_CHARS = {".", ",", "!", "?", "\n"}
+
 # Non-streaming chat function (for comparison)
 def chat_without_streaming(prompt, model="llama3-8b-8192"):
     """
@@ -37,22 +205,13 @@ def chat_without_streaming(prompt, model="llama3-8b-8192"):
     Returns:
         dict: The response data including content and timing information
     """
-    start_time = time.time()
-    
-    # API endpoint
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    
-    # Request headers
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    start_time = time.perf_counter()
     
     # Request body
     data = {
         "model": model,
         "messages": [
-            {"role": "system", "content": "You are a helpful AI assistant."},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.7,
@@ -61,129 +220,177 @@ def chat_without_streaming(prompt, model="llama3-8b-8192"):
     
     try:
         # Send request
-        response = requests.post(url, headers=headers, json=data)
+        response = post_chat_request(data)
         response.raise_for_status()
         result = response.json()
         
         # Calculate time
-        end_time = time.time()
+        end_time = time.perf_counter()
         response_time = end_time - start_time
         
         return {
             "content": result["choices"][0]["message"]["content"],
             "response_time": response_time,
-            "total_tokens": len(result["choices"][0]["message"]["content"].split())
+            "total_tokens": result["usage"]["completion_tokens"]
         }
         
     except requests.exceptions.RequestException as e:
         return {
             "content": f"Error: {str(e)}",
-            "response_time": time.time() - start_time,
+            "response_time": time.perf_counter() - start_time,
             "total_tokens": 0
         }
 
-# Streaming chat function
-def chat_with_streaming(prompt, model="llama3-8b-8192", display=True):
+# Streaming chat generator
+def stream_chat(prompt, model="llama3-8b-8192"):
     """
-    Send a prompt to the Groq API with streaming enabled.
+    Stream a response from the Groq API, yielding each token as it arrives.
+    
+    Every item is a (content, timing_info) tuple. timing_info is the same dict
+    on every yield and is updated in place: while streaming it holds
+    "time_to_first_token" and "token_count", and once the stream ends it also
+    holds "response_time", "total_tokens" and "tokens_per_second".
     
     Args:
         prompt (str): The user's message
         model (str): The model to use for generation
-        display (bool): Whether to display the streaming output
         
-    Returns:
-        dict: The response data including content and timing information
+    Yields:
+        tuple: (content, timing_info) for each content delta
+        
+    Raises:
+        requests.exceptions.RequestException: If the request fails
     """
-    start_time = time.time()
-    
-    # API endpoint
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    
-    # Request headers
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    start_time = time.perf_counter()
     
     # Request body
     data = {
         "model": model,
         "messages": [
-            {"role": "system", "content": "You are a helpful AI assistant."},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.7,
         "max_tokens": 500,
-        "stream": True  # Enable streaming
+        "stream": True,  # Enable streaming
+        "stream_options": {"include_usage": True}  # Send token usage in the final chunk
     }
     
-    try:
-        # Send request with stream=True to get response chunks
-        response = requests.post(url, headers=headers, json=data, stream=True)
+    # Send request with stream=True to get response chunks
+    response = post_chat_request(data, stream=True)
+    # Closing the response returns its connection to the pool, even when
+    # the caller stops reading the generator early
+    with response:
         response.raise_for_status()
-        
-        # Variables to collect the full response and track tokens
-        full_response = ""
+    
+        timing_info = {"time_to_first_token": 0, "token_count": 0}
         token_count = 0
+        usage = None
         first_token_time = None
+    
+        # Local names for functions called on every token
+        loads = json_loads
+        perf_counter = time.perf_counter
+    
+        # Process the streaming response one event at a time
+        for _, line in SSEParser(response.raw).events():
+            # Stop at the "[DONE]" message
+            if line == b"[DONE]":
+                break
         
-        if display:
-            print("\nStreaming response: ", end="", flush=True)
-        
-        # Process the streaming response
-        for line in response.iter_lines():
-            if line:
-                # Skip empty lines
-                line = line.decode('utf-8')
-                
-                # Skip the "data: " prefix
-                if line.startswith("data: "):
-                    line = line[6:]
-                
-                # Skip the "[DONE]" message
-                if line == "[DONE]":
-                    continue
-                
-                try:
-                    # Parse the JSON data
-                    data = json.loads(line)
-                    
-                    # Extract the content delta
-                    if "choices" in data and len(data["choices"]) > 0:
-                        choice = data["choices"][0]
-                        if "delta" in choice and "content" in choice["delta"]:
-                            content = choice["delta"]["content"]
-                            
-                            # Record time of first token
-                            if token_count == 0:
-                                first_token_time = time.time()
-                            
-                            # Add to full response
-                            full_response += content
-                            token_count += 1
-                            
-                            # Display the token if requested
-                            if display:
-                                print(content, end="", flush=True)
-                except json.JSONDecodeError:
-                    # Skip invalid JSON
-                    continue
-        
-        # Calculate timing metrics
-        end_time = time.time()
-        total_time = end_time - start_time
-        time_to_first_token = first_token_time - start_time if first_token_time else 0
+            try:
+                # Parse the JSON chunk straight from bytes; both orjson and json
+                # accept bytes, so there is no separate decode step
+                evt = loads(line)
+            except ValueError:
+                # Skip invalid JSON
+                continue
         
-        if display:
-            print("\n")  # Add a newline after streaming
+            # The final chunk carries the real token usage
+            chunk_usage = evt.get("usage") or evt.get("x_groq", {}).get("usage")
+            if chunk_usage:
+                usage = chunk_usage
         
-        return {
-            "content": full_response,
-            "response_time": total_time,
-            "time_to_first_token": time_to_first_token,
-            "total_tokens": token_count
-        }
+            # Extract the content delta
+            choices = evt.get("choices")
+            content = choices[0].get("delta", {}).get("content") if choices else None
+            if not content:
+                continue
+        
+            token_count += 1
+            timing_info["token_count"] = token_count
+            if token_count == 1:
+                first_token_time = perf_counter()
+                timing_info["time_to_first_token"] = first_token_time - start_time
+        
+            yield content, timing_info
+    
+    # Calculate timing metrics
+    end_time = time.perf_counter()
+    
+    # Prefer the API's token count; fall back to the number of chunks received
+    total_tokens = usage["completion_tokens"] if usage else token_count
+    generation_time = end_time - first_token_time if first_token_time else 0
+    
+    timing_info["response_time"] = end_time - start_time
+    timing_info["total_tokens"] = total_tokens
+    timing_info["tokens_per_second"] = total_tokens / generation_time if generation_time > 0 else 0
+
+# Streaming chat function
+def chat_with_streaming(prompt, model="llama3-8b-8192", display=True):
+    """
+    Send a prompt to the Groq API with streaming enabled.
+    
+    Collects the tokens from stream_chat() into a single response, optionally
+    displaying them as they arrive.
+    
+    Args:
+        prompt (str): The user's message
+        model (str): The model to use for generation
+        display (bool): Whether to display the streaming output
+        
+    Returns:
+        dict: The response data including content and timing information
+    """
+    start_time = time.perf_counter()
+    
+    # Variables to collect the full response
+    chunks = []  # Joined once at the end to avoid quadratic string building
+    timing_info = {}
+    pending_output = []  # Tokens waiting to be written to the terminal
+    last_write_time = 0
+    
+    if display:
+        print("\nStreaming response: ", end="", flush=True)
+    
+    # Local names for functions called on every token
+    write = sys.stdout.write
+    flush = sys.stdout.flush
+    perf_counter = time.perf_counter
+    
+    try:
+        for content, timing_info in stream_chat(prompt, model):
+            # Add to full response
+            chunks.append(content)
+            
+            if not display:
+                continue
+            
+            if timing_info["token_count"] == 1:
+                # Fast path: show the first token right away
+                write(content)
+                flush()
+                last_write_time = perf_counter()
+            else:
+                # Later tokens are batched to save on writes and flushes
+                pending_output.append(content)
+                now = perf_counter()
+                if (len(pending_output) >= DISPLAY_BATCH_TOKENS
+                        or now - last_write_time >= DISPLAY_BATCH_SECONDS):
+                    write("".join(pending_output))
+                    flush()
+                    pending_output.clear()
+                    last_write_time = now
         
     except requests.exceptions.RequestException as e:
         error_msg = f"Error: {str(e)}"
@@ -192,10 +399,29 @@ def chat_with_streaming(prompt, model="llama3-8b-8192", display=True):
         
         return {
             "content": error_msg,
-            "response_time": time.time() - start_time,
+            "response_time": time.perf_counter() - start_time,
             "time_to_first_token": 0,
-            "total_tokens": 0
+            "total_tokens": 0,
+            "tokens_per_second": 0
         }
+    
+    # Write any tokens still waiting in the batch
+    if pending_output:
+        write("".join(pending_output))
+        flush()
+    
+    if display:
+        print("\n")  # Add a newline after streaming
+    
+    # A response with no content never yields, so stream_chat's timing dict
+    # is never seen; fall back to the time spent here
+    return {
+        "content": "".join(chunks),
+        "response_time": timing_info.get("response_time", time.perf_counter() - start_time),
+        "time_to_first_token": timing_info.get("time_to_first_token", 0),
+        "total_tokens": timing_info.get("total_tokens", 0),
+        "tokens_per_second": timing_info.get("tokens_per_second", 0)
+    }
 
 # Demonstration function
 def demonstrate_streaming():
@@ -238,6 +464,7 @@ def demonstrate_streaming():
         
         print(f"Total response time: {streaming_response['response_time']:.2f} seconds")
         print(f"Time to first token: {streaming_response['time_to_first_token']:.2f} seconds")
+        print(f"Tokens per second: {streaming_response['tokens_per_second']:.2f}")
         
         streaming_results.append(streaming_response)
     
@@ -280,7 +507,7 @@ def interactive_demo():
         # Non-streaming
         print("\n1. WITHOUT STREAMING")
         print("Generating response (waiting for full response)...")
-        start = time.time()
+        start = time.perf_counter()
         response = chat_without_streaming(prompt)
         print(f"Response time: {response['response_time']:.2f} seconds")
         print(f"Response: {response['content']}")
@@ -308,21 +535,42 @@ def typing_effect_demo():
     
     print("\nGenerating response with typing effect...")
     
-    # Get streaming response but don't display it
-    response = chat_with_streaming(prompt, display=False)
-    content = response["content"]
+    # Type each token out as it arrives instead of waiting for the full
+    # response. Tokens are split into words so there is one write and flush
+    # per word rather than per character with the same total delay
+    timing_info = None
+    # Time spent typing, which the stream's own timings include and which is
+    # subtracted below so they measure only the API
+    render_time = 0.0
+    try:
+        for content, timing_info in stream_chat(prompt):
+            render_start = time.perf_counter()
+            for piece in TYPING_PIECE_PATTERN.findall(content):
+                sys.stdout.write(piece)
+                sys.stdout.flush()
+                # Pause a little longer after punctuation for a more natural effect
+                delay = 0.02 * len(piece) + (0.03 * (piece in TYPING_PAUSE_CHARS))
+                time.sleep(delay)
+            render_time += time.perf_counter() - render_start
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {str(e)}")
+        return
+    
+    if timing_info is None:
+        print("\nNo response received.")
+        return
     
-    # Simulate typing effect
-    for char in content:
-        print(char, end="", flush=True)
-        # Randomize typing speed slightly for more natural effect
-        delay = 0.02 + (0.03 * (char in ['.', ',', '!', '?', '\n']))
-        time.sleep(delay)
+    # Chunks that arrive while a word is being typed wait in the socket
+    # buffer, so without the typing time this is close to the API's time
+    response_time = timing_info['response_time'] - render_time
+    generation_time = response_time - timing_info['time_to_first_token']
+    tokens_per_second = timing_info['total_tokens'] / generation_time if generation_time > 0 else 0
     
     print("\n\nTyping effect complete!")
-    print(f"Total tokens: {response['total_tokens']}")
-    print(f"Total response time: {response['response_time']:.2f} seconds")
-    print(f"Time to first token: {response['time_to_first_token']:.2f} seconds")
+    print(f"Total tokens: {timing_info['total_tokens']}")
+    print(f"Total response time: {response_time:.2f} seconds (excluding {render_time:.2f} seconds of typing)")
+    print(f"Time to first token: {timing_info['time_to_first_token']:.2f} seconds")
+    print(f"Tokens per second: {tokens_per_second:.2f}")
 
 if __name__ == "__main__":
     print("Module 12: Performance Optimization - Streaming Responses")
@@ -7,7 +7,6 @@ It allows users to interact with the agent and see how it handles both task requ
 
 import os
 import sys
-import time
 from typing import List, Dict, Any
 
 # Add the parent directory to the path so we can import the agent_framework module
@@ -16,20 +15,6 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Import the agent framework
 from module14.agent_framework import Agent, AVAILABLE_MODELS
 
-def print_with_typing_effect(text: str, delay: float = 0.01):
-    """
-    Print text with a typing effect to simulate the agent thinking and responding.
-    
-    Args:
-        text: The text to print
-        delay: The delay between characters in seconds
-    """
-    for char in text:
-        print(char, end='', flush=True)
-        time.sleep(delay)
-    print()
-
-
 def print_header():
     """Print the demo header."""
     header = """
@@ -48,19 +33,6 @@ def print_header():
     print(header)
 
 
-def print_agent_thinking():
-    """Print a thinking animation."""
-    thinking_frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
-    print("Agent is thinking ", end="", flush=True)
-    
-    for _ in range(10):
-        for frame in thinking_frames:
-            print(f"\rAgent is thinking {frame}", end="", flush=True)
-            time.sleep(0.1)
-    
-    print("\r" + " " * 30 + "\r", end="", flush=True)
-
-
 def select_model() -> str:
     """
     Allow the user to select a model from the available models.
@@ -102,15 +74,14 @@ def main():
         # Check if the user wants to exit
         if user_input.lower() in ["exit", "quit", "bye"]:
             print("\nThank you for using the AI Agent Demo. Goodbye!")
+            agent.close()
             break
         
-        # Process the user input
-        print_agent_thinking()
-        response = agent.process_user_input(user_input)
-        
-        # Print the response with a typing effect
-        print("\nAgent:", end=" ")
-        print_with_typing_effect(response)
+        # Print the response as the agent produces it
+        print("\nAgent:", end=" ", flush=True)
+        for chunk in agent.process_user_input_stream(user_input):
+            print(chunk, end="", flush=True)
+        print()
 
 
 if __name__ == "__main__":
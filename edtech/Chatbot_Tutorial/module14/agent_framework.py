@@ -10,12 +10,46 @@ This module provides the core components for building an agent that can:
 
 import json
 import os
+import re
+import copy
+import time
+import hashlib
+import datetime
 import requests
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor, Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, List, Any, Optional, Iterator, Union, Tuple
 from dotenv import load_dotenv
 
+# orjson encodes and decodes JSON several times faster than json; fall back
+# to json if it isn't installed. json_dumps returns UTF-8 bytes either way.
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+        """Serialize obj to JSON bytes, optionally indented and with sorted keys."""
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+        """Serialize obj to JSON bytes, optionally indented and with sorted keys."""
+        return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys).encode("utf-8")
+
+# The semantic response cache needs sentence-transformers and faiss;
+# without them only exact-match caching is used
+try:
+    import numpy as np
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
 # Import the tool registry
-from tools import create_default_tool_registry
+from tools import create_default_tool_registry, calculator, get_current_time
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +59,195 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 AVAILABLE_MODELS = ["llama3-8b-8192", "llama3-70b-8192", "mixtral-8x7b-32768"]
 DEFAULT_MODEL = "llama3-8b-8192"
 
+# Groq chat completions endpoint
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# (connect, read) timeouts for LLM requests, in seconds
+LLM_TIMEOUT = (3.05, 30)
+
+# How long a cached LLM response stays valid, in seconds
+LLM_CACHE_TTL = 3600
+
+# Embedding model and minimum cosine similarity for the semantic cache
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.90
+
+# Keyword and number patterns, compiled once instead of scanning keyword
+# lists on every call
+TIME_RE = re.compile(r'\b(?:time|clock|hour|date|day)s?\b')
+MATH_RE = re.compile(r'\b(?:calculate|compute|math|add|subtract|multiply|divide)\b')
+TASK_RE = re.compile(r'\b(?:time|clock|hour|date|day|calculate|compute|square|math|'
+                     r'add|subtract|multiply|divide)s?\b')
+SQUARE_RE = re.compile(r'square\s+of\s+(\d+)')
+NUM_RE = re.compile(r'\d+')
+# Number placeholders in learned plan templates
+PLACEHOLDER_RE = re.compile(r'<N(\d+)>')
+EXPR_RE = re.compile(r'\d+\s*[+\-*/^]\s*\d+')
+
+# Fast paths: requests that are nothing but a trivial, well-known intent
+# are answered locally, without any LLM call. Patterns must match the
+# whole (lower-cased) input, so longer multi-step tasks still get planned.
+def _answer_time(match: re.Match) -> str:
+    """Answer a request for the current time."""
+    return get_current_time()
+
+
+def _answer_square(match: re.Match) -> str:
+    """Answer a request for the square of a number."""
+    num = int(match.group(1))
+    return f"The square of {num} is {num ** 2}"
+
+
+def _answer_expression(match: re.Match) -> str:
+    """Answer a request to evaluate a simple binary expression."""
+    expression = match.group(1)
+    try:
+        return f"{expression} = {calculator(expression)}"
+    except ValueError as e:
+        return f"I couldn't calculate {expression}: {e}"
+
+
+FAST_PATHS = [
+    (re.compile(r"(?:what(?:'s| is) the (?:current )?time|what time is it|tell me the time)"
+                r"(?: now)?\s*[?.!]?"), _answer_time),
+    (re.compile(r"(?:what(?:'s| is) |calculate |compute )?(?:the )?square of (\d+)\s*[?.!]?"),
+     _answer_square),
+    (re.compile(r"(?:what(?:'s| is) |calculate |compute )?(\d+\s*[+\-*/^]\s*\d+)\s*[?.!]?"),
+     _answer_expression),
+]
+
+# Prompt instructions. Each LLM call sends the unchanging instructions (and
+# tool schema) first, as a system message, and only the per-call details as
+# the user message, so identical prefixes can be served from a provider's
+# prompt cache.
+TASK_CHECK_PROMPT = """Determine if the user input is asking for a task to be completed or just asking a question.
+
+A task request would be something like "find information about X" or "calculate Y" or "help me with Z".
+A question would be something like "what is X?" or "how does Y work?".
+
+Tasks often involve actions like calculating, finding, getting current information, or performing operations.
+Specifically, requests about current time, date, or mathematical calculations are always tasks.
+
+Return JSON with a single field "is_task" set to true or false."""
+
+PLANNING_PROMPT = """You break tasks down into a sequence of steps. For each step, indicate if a tool should be used.
+
+The following tools are available:
+{tools_text}
+
+Return as a JSON list of steps, where each step has:
+- "step": step number
+- "description": what to do in this step
+- "requires_tool": boolean indicating if this step needs a tool
+- "tool_name": (optional) name of the tool to use if requires_tool is true
+- "depends_on": (optional) list of step numbers whose results this step needs; omit it if the step is independent
+
+Example:
+[
+    {{"step": 1, "description": "Understand the user's request", "requires_tool": false}},
+    {{"step": 2, "description": "Calculate 25 * 16", "requires_tool": true, "tool_name": "calculator"}}
+]"""
+
+PARAMETERS_PROMPT = """You choose the parameter values for a tool call in one step of a task.
+
+The "{tool_name}" tool has these parameters:
+{parameters_text}
+
+Determine the appropriate values for these parameters based on the step description.
+Return a JSON object with the parameter names as keys and their values."""
+
+BATCH_PARAMETERS_PROMPT = """You choose the parameter values for the tool calls in several steps of a task.
+
+You are given the parameters of each tool that is used, and a numbered list of steps with the tool each one uses.
+Determine the appropriate parameter values for every step based on its description.
+Return a JSON object with the step numbers as keys, each mapping to a JSON object with the parameter names as keys and their values.
+
+Example:
+{"1": {"expression": "25 * 16"}, "3": {"query": "Python programming", "limit": 1}}"""
+
+# System messages that never change, built once and shared by every call
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an AI assistant with access to tools. You can perform tasks like calculating math expressions and telling the current time. Always use your tools when appropriate instead of making up answers."
+}
+TASK_CHECK_MESSAGE = {"role": "system", "content": TASK_CHECK_PROMPT}
+BATCH_PARAMETERS_MESSAGE = {"role": "system", "content": BATCH_PARAMETERS_PROMPT}
+
+# Token budget for the conversation history sent with a question, and the
+# largest number of entries kept in collected_information or working_memory
+# before the oldest half is summarized
+HISTORY_TOKEN_BUDGET = 6000
+MAX_MEMORY_ITEMS = 20
+
+# Where learned plan templates are kept between runs
+PLAN_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "agent", "plans.json")
+
+
+def _task_signature(task_description: str) -> str:
+    """Normalize a task so requests that differ only in their numbers match."""
+    return NUM_RE.sub('<N>', task_description.lower().strip())
+
+
+def _templatize_plan(plan: List[Dict[str, Any]], numbers: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Replace the task's numbers in a plan's text fields with numbered placeholders.
+
+    Returns None when a number occurs more than once in the task: the plan
+    can't show which occurrence it used, so filling the template with
+    another task's numbers could pick the wrong one.
+    """
+    if len(set(numbers)) != len(numbers):
+        return None
+    placeholders = {number: f'<N{i}>' for i, number in enumerate(numbers)}
+
+    def placeholder(match: re.Match) -> str:
+        return placeholders.get(match.group(), match.group())
+
+    template = copy.deepcopy(plan)
+    for step in template:
+        for field, value in step.items():
+            if isinstance(value, str):
+                # One pass, so digits inside placeholders are never replaced
+                step[field] = NUM_RE.sub(placeholder, value)
+    return template
+
+
+def _fill_plan(template: List[Dict[str, Any]], numbers: List[str]) -> List[Dict[str, Any]]:
+    """Build a plan from a template by putting a task's numbers back in."""
+    def number(match: re.Match) -> str:
+        return numbers[int(match.group(1))]
+
+    plan = copy.deepcopy(template)
+    for step in plan:
+        for field, value in step.items():
+            if isinstance(value, str):
+                step[field] = PLACEHOLDER_RE.sub(number, value)
+    return plan
+
+
+class LLMError(Exception):
+    """Raised when the LLM API can't be reached or keeps returning errors."""
+
+
+def _llm_retries() -> Retry:
+    """
+    Build the retry policy for LLM requests.
+
+    Rate limits (429) and server errors are retried up to three times with
+    exponential backoff, waiting as long as a Retry-After header asks. The
+    last response is returned rather than raised, so it can be reported.
+    """
+    options = dict(total=3, backoff_factor=0.5,
+                   status_forcelist=[429, 500, 502, 503, 504],
+                   allowed_methods=["POST"], respect_retry_after_header=True,
+                   raise_on_status=False)
+    try:
+        # Random jitter keeps clients that failed together from retrying together
+        return Retry(backoff_jitter=0.5, **options)
+    except TypeError:
+        # urllib3 before 2.0 has no backoff_jitter
+        return Retry(**options)
+
 
 class Agent:
     """
@@ -37,25 +260,101 @@ class Agent:
     - Decision-making logic for autonomous operation
     """
 
-    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.7):
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                 semantic_cache: bool = True):
         """
         Initialize the agent with a model and temperature.
 
         Args:
             model: The LLM model to use
             temperature: The temperature for LLM generation
+            semantic_cache: Whether to answer near-duplicate questions from
+                earlier answers (needs sentence-transformers and faiss)
         """
         self.model = model
         self.temperature = temperature
         self.tool_registry = create_default_tool_registry()
 
+        # Request headers never change, so build them once
+        self._auth_headers = {
+            "Authorization": f"Bearer {GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+
+        # One HTTP session per agent, so the planning, parameter and summary
+        # calls of a turn reuse a kept-alive connection instead of paying
+        # for a new TCP and TLS handshake each time
+        self._http = requests.Session()
+        self._http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                                 max_retries=_llm_retries()))
+
+        # Worker threads for LLM calls that don't depend on each other
+        self._pool = ThreadPoolExecutor(max_workers=4)
+
+        # Cache of LLM responses: request hash -> (timestamp, response)
+        self._cache: Dict[str, tuple] = {}
+
+        # Plans learned from the LLM: task signature -> plan template
+        self._plan_cache: Dict[str, List[Dict[str, Any]]] = self._load_plan_cache()
+
+        # The planning instructions and tool schema are the same for every
+        # planning call, so the system message is only rebuilt when the
+        # registry's tool list changes; likewise for each tool's parameter
+        # message (tool name -> (parameters text, message))
+        self._plan_message: Dict[str, str] = {}
+        self._plan_message_tools = None
+        self._parameters_messages: Dict[str, tuple] = {}
+
+        # Semantic cache: embeddings of answered questions in a faiss index,
+        # with (timestamp, question, answer) for each vector in _sem_store
+        self._embedder = None
+        if semantic_cache and SentenceTransformer is not None:
+            self._embedder = SentenceTransformer(EMBEDDING_MODEL)
+            self._sem_index = faiss.IndexFlatIP(self._embedder.get_sentence_embedding_dimension())
+            self._sem_store: List[tuple] = []
+
         # Initialize state
         self.reset_state()
 
+    def close(self):
+        """Save the plan cache and close the agent's HTTP session and worker threads."""
+        self.save_plan_cache()
+        self._pool.shutdown(wait=False)
+        self._http.close()
+
+    @staticmethod
+    def _load_plan_cache() -> Dict[str, List[Dict[str, Any]]]:
+        """Load plan templates saved by an earlier run, if there are any."""
+        try:
+            with open(PLAN_CACHE_PATH, "rb") as f:
+                return json_loads(f.read())
+        except (OSError, ValueError):
+            return {}
+
+    def save_plan_cache(self):
+        """Save the learned plan templates so they survive a restart."""
+        if not self._plan_cache:
+            return
+        try:
+            os.makedirs(os.path.dirname(PLAN_CACHE_PATH), exist_ok=True)
+            with open(PLAN_CACHE_PATH, "wb") as f:
+                f.write(json_dumps(self._plan_cache))
+        except OSError as e:
+            print(f"Error saving plan cache: {e}")
+
+    def __del__(self):
+        # Only release connections and threads here: during interpreter
+        # shutdown builtins such as open() may already be gone, so the plan
+        # cache is saved by close() alone. Nothing to release if __init__
+        # failed part way through.
+        if hasattr(self, "_pool"):
+            self._pool.shutdown(wait=False)
+            self._http.close()
+
     def reset_state(self):
         """Reset the agent's state to its initial values."""
         self.state = {
-            "conversation": [],  # Conversation history
+            "conversation": [SYSTEM_MESSAGE],  # Conversation history, starting with the system message
             "current_plan": None,  # Current task plan
             "current_step_index": 0,  # Index of the current step in the plan
             "task_completed": False,  # Whether the current task is completed
@@ -73,26 +372,90 @@ class Agent:
         """
         self.state["conversation"].append({"role": role, "content": content})
 
+    def _trim_history(self, max_tokens: int = HISTORY_TOKEN_BUDGET):
+        """
+        Drop the oldest messages from the conversation until it fits a token budget.
+
+        The system message is always kept. Tokens are estimated as one per
+        four characters.
+
+        Args:
+            max_tokens: The most tokens the conversation may use
+        """
+        conversation = self.state["conversation"]
+        has_system = bool(conversation) and conversation[0]["role"] == "system"
+        first = 1 if has_system else 0
+
+        total = sum(len(message["content"]) // 4 for message in conversation)
+        cut = first
+        # Always keep the latest message, even if it alone is over budget
+        while total > max_tokens and cut < len(conversation) - 1:
+            total -= len(conversation[cut]["content"]) // 4
+            cut += 1
+        del conversation[first:cut]
+
+    def _compact_memory(self, name: str):
+        """
+        Summarize the oldest half of a state dictionary once it grows too large.
+
+        Args:
+            name: The state key, "collected_information" or "working_memory"
+        """
+        memory = self.state[name]
+        if len(memory) <= MAX_MEMORY_ITEMS:
+            return
+
+        keys = list(memory)[:len(memory) // 2]
+        oldest = {key: memory[key] for key in keys}
+        messages = [{"role": "user", "content": (
+            "Summarize the following information concisely, keeping every fact "
+            "that could matter later:\n" + json_dumps(oldest, indent=True).decode("utf-8"))}]
+        try:
+            summary = self.get_llm_response(messages)
+        except LLMError as e:
+            print(f"Error compacting {name}: {e}")
+            return
+
+        for key in keys:
+            del memory[key]
+        # Put the summary first so it stays ahead of the newer entries
+        self.state[name] = {f"summary_{keys[0]}_to_{keys[-1]}": summary, **memory}
+
+    def _cache_key(self, messages: List[Dict[str, str]], json_mode: bool) -> str:
+        """Hash everything that determines an LLM response into a cache key."""
+        payload = json_dumps([self.model, self.temperature, json_mode, messages], sort_keys=True)
+        return hashlib.sha256(payload).hexdigest()
+
     def get_llm_response(self, messages: List[Dict[str, str]],
-                         json_mode: bool = False) -> str:
+                         json_mode: bool = False,
+                         stream: bool = False) -> Union[str, Iterator[str]]:
         """
         Get a response from the LLM.
 
+        Successful responses are cached for LLM_CACHE_TTL seconds, so a
+        repeated prompt (such as the task check or planning prompt for a
+        recurring request) is answered without calling the API.
+
         Args:
             messages: The messages to send to the LLM
             json_mode: Whether to request a JSON response
+            stream: Whether to return an iterator over the response text as
+                it is generated, instead of waiting for the whole response.
+                JSON responses should not be streamed, since they can only
+                be parsed once complete.
 
         Returns:
-            The LLM's response as a string
-        """
-        # API endpoint
-        url = "https://api.groq.com/openai/v1/chat/completions"
+            The LLM's response as a string, or an iterator over its pieces
+            if stream is True
 
-        # Request headers
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        Raises:
+            LLMError: If the request fails after retries (when streaming,
+                while iterating)
+        """
+        key = self._cache_key(messages, json_mode)
+        cached = self._cache.get(key)
+        if cached is not None and time.time() - cached[0] < LLM_CACHE_TTL:
+            return iter([cached[1]]) if stream else cached[1]
 
         # Request body
         data = {
@@ -106,16 +469,105 @@ class Agent:
         if json_mode:
             data["response_format"] = {"type": "json_object"}
 
+        if stream:
+            data["stream"] = True
+            return self._stream_llm_response(key, data)
+
         # Send request to Groq API
-        response = requests.post(url, headers=headers, json=data)
+        response = self._post_llm_request(data)
+        result = json_loads(response.content)
+        content = result["choices"][0]["message"]["content"]
+        self._cache[key] = (time.time(), content)
+        return content
 
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
+    def _post_llm_request(self, data: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """
+        Send a request to the Groq API, raising LLMError if it fails.
+
+        Transient errors have already been retried by the session.
+
+        Args:
+            data: The request body
+            stream: Whether to stream the response body
+
+        Returns:
+            The successful response
+        """
+        try:
+            response = self._http.post(GROQ_API_URL, headers=self._auth_headers,
+                                       data=json_dumps(data), timeout=LLM_TIMEOUT,
+                                       stream=stream)
+        except requests.exceptions.RequestException as e:
+            raise LLMError(f"Error: {e}") from e
+
+        if response.status_code != 200:
             error_msg = f"Error: {response.status_code}, {response.text}"
-            print(error_msg)
-            return f"I encountered an error when trying to process your request: {error_msg}"
+            response.close()
+            raise LLMError(error_msg)
+        return response
+
+    def _stream_llm_response(self, key: str, data: Dict[str, Any]) -> Iterator[str]:
+        """
+        Send a streaming request and yield the response text as it arrives.
+
+        Args:
+            key: The cache key for the request
+            data: The request body, with streaming enabled
+
+        Yields:
+            Pieces of the LLM's response
+
+        Raises:
+            LLMError: If the request fails or the stream breaks off
+        """
+        response = self._post_llm_request(data, stream=True)
+
+        with response:
+            # Each server-sent event is a "data: {...}" line holding one delta
+            chunks = []
+            try:
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "):
+                        continue
+                    line = line[6:]
+                    if line == b"[DONE]":
+                        break
+                    try:
+                        choices = json_loads(line).get("choices")
+                    except ValueError:
+                        continue
+                    content = choices[0].get("delta", {}).get("content") if choices else None
+                    if content:
+                        chunks.append(content)
+                        yield content
+            except requests.exceptions.RequestException as e:
+                raise LLMError(f"Error: the response stream broke off: {e}") from e
+
+        self._cache[key] = (time.time(), "".join(chunks))
+
+    def _embed(self, text: str):
+        """Embed text as a normalized float32 row vector for the faiss index."""
+        return self._embedder.encode([text], normalize_embeddings=True).astype(np.float32)
+
+    def _semantic_lookup(self, vector) -> Optional[str]:
+        """
+        Find a cached answer to a question similar to the embedded input.
+
+        Args:
+            vector: The embedded user input
+
+        Returns:
+            The cached answer, or None if there is no close, fresh match
+        """
+        if self._sem_index.ntotal == 0:
+            return None
+        scores, ids = self._sem_index.search(vector, 1)
+        if scores[0][0] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        timestamp, _, response = self._sem_store[ids[0][0]]
+        if time.time() - timestamp >= LLM_CACHE_TTL:
+            return None
+        return response
 
     def determine_if_task(self, user_input: str) -> bool:
         """
@@ -130,109 +582,116 @@ class Agent:
         # Check for common task patterns first
         lower_input = user_input.lower()
 
-        # Direct checks for time and math-related queries
-        if any(phrase in lower_input for phrase in ["time", "clock", "hour", "date", "day"]):
-            return True
-
-        if any(phrase in lower_input for phrase in ["calculate", "compute", "square", "math", "add", "subtract", "multiply", "divide"]):
+        # Direct check for time and math-related queries
+        if TASK_RE.search(lower_input):
             return True
 
         # For other queries, use the LLM to determine if it's a task
-        prompt = f"""
-        Determine if the following user input is asking for a task to be completed or just asking a question.
-
-        User input: "{user_input}"
-
-        A task request would be something like "find information about X" or "calculate Y" or "help me with Z".
-        A question would be something like "what is X?" or "how does Y work?".
-
-        Tasks often involve actions like calculating, finding, getting current information, or performing operations.
-        Specifically, requests about current time, date, or mathematical calculations are always tasks.
-
-        Return JSON with a single field "is_task" set to true or false.
-        """
-
-        messages = [{"role": "user", "content": prompt}]
-        response = self.get_llm_response(messages, json_mode=True)
-
+        messages = [
+            TASK_CHECK_MESSAGE,
+            {"role": "user", "content": f'User input: "{user_input}"'}
+        ]
         try:
-            result = json.loads(response)
+            response = self.get_llm_response(messages, json_mode=True)
+            result = json_loads(response)
             return result.get("is_task", False)
         except:
-            # If we can't parse the response, assume it's not a task
+            # If the LLM fails or we can't parse the response, assume it's not a task
             return False
 
+    def _planning_message(self) -> Dict[str, str]:
+        """Get the planning system message for the registry's current tools."""
+        tools_text = self.tool_registry.tools_text()
+        if tools_text is not self._plan_message_tools:
+            self._plan_message = {"role": "system",
+                                  "content": PLANNING_PROMPT.format(tools_text=tools_text)}
+            self._plan_message_tools = tools_text
+        return self._plan_message
+
+    def _parameters_message(self, tool_name: str) -> Dict[str, str]:
+        """Get the parameter system message for a tool, rebuilt only if its parameters change."""
+        parameters_text = self.tool_registry.parameters_text(tool_name)
+        cached = self._parameters_messages.get(tool_name)
+        if cached is None or cached[0] is not parameters_text:
+            message = {"role": "system", "content": PARAMETERS_PROMPT.format(
+                tool_name=tool_name, parameters_text=parameters_text)}
+            cached = (parameters_text, message)
+            self._parameters_messages[tool_name] = cached
+        return cached[1]
+
+    def _cached_plan(self, task_description: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the cached plan for a task's signature, filled in with its numbers."""
+        template = self._plan_cache.get(_task_signature(task_description))
+        if template is None:
+            return None
+        return _fill_plan(template, NUM_RE.findall(task_description.lower()))
+
     def plan_task(self, task_description: str) -> List[Dict[str, Any]]:
         """
         Break down a task into steps.
 
+        Plans written by the LLM are remembered in the plan cache.
+
         Args:
             task_description: The description of the task
 
         Returns:
             A list of steps to complete the task
         """
+        plan, template = self._plan_task(task_description)
+        if template is not None:
+            self._plan_cache[_task_signature(task_description)] = template
+        return plan
+
+    def _plan_task(self, task_description: str) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """
+        Break down a task into steps without touching the plan cache.
+
+        Args:
+            task_description: The description of the task
+
+        Returns:
+            The plan, and the template to cache for it if the LLM wrote it
+            (None otherwise)
+        """
         # Check for common patterns and create direct plans
         lower_task = task_description.lower()
 
         # Handle time-related queries
-        if any(phrase in lower_task for phrase in ["time", "clock", "hour", "date", "day"]):
+        if TIME_RE.search(lower_task):
             return [
                 {"step": 1, "description": "Get the current time", "requires_tool": True, "tool_name": "get_current_time"}
-            ]
+            ], None
 
         # Handle math-related queries
-        if "square of" in lower_task and any(c.isdigit() for c in lower_task):
-            # Extract the number if possible
-            try:
-                # Find all numbers in the string
-                import re
-                numbers = re.findall(r'\d+', lower_task)
-                if numbers:
-                    num = numbers[0]
-                    return [
-                        {"step": 1, "description": f"Calculate the square of {num}", "requires_tool": True, "tool_name": "calculator", "expression": f"{num} * {num}"}
-                    ]
-            except:
-                pass
-
-        if any(phrase in lower_task for phrase in ["calculate", "compute", "math", "add", "subtract", "multiply", "divide"]):
+        square = SQUARE_RE.search(lower_task)
+        if square:
+            num = square.group(1)
+            return [
+                {"step": 1, "description": f"Calculate the square of {num}", "requires_tool": True, "tool_name": "calculator", "expression": f"{num} * {num}"}
+            ], None
+
+        if MATH_RE.search(lower_task):
             return [
                 {"step": 1, "description": "Perform the mathematical calculation", "requires_tool": True, "tool_name": "calculator"}
-            ]
+            ], None
 
-        # For other tasks, use the LLM to create a plan
-        # Get the list of available tools
-        tools_list = self.tool_registry.list_tools()
-        tools_json = json.dumps(tools_list, indent=2)
-
-        # Create a planning prompt
-        planning_prompt = f"""
-        I need to complete this task: {task_description}
-
-        I have the following tools available:
-        {tools_json}
-
-        Please break this down into a sequence of steps. For each step, indicate if a tool should be used.
-        Return as a JSON list of steps, where each step has:
-        - "step": step number
-        - "description": what to do in this step
-        - "requires_tool": boolean indicating if this step needs a tool
-        - "tool_name": (optional) name of the tool to use if requires_tool is true
-
-        Example:
-        [
-            {{"step": 1, "description": "Understand the user's request", "requires_tool": false}},
-            {{"step": 2, "description": "Calculate 25 * 16", "requires_tool": true, "tool_name": "calculator"}}
-        ]
-        """
+        # Reuse a plan learned for the same kind of task, with this task's numbers
+        cached_plan = self._cached_plan(task_description)
+        if cached_plan is not None:
+            return cached_plan, None
+        numbers = NUM_RE.findall(lower_task)
 
+        # For other tasks, use the LLM to create a plan
         try:
-            planning_messages = [{"role": "user", "content": planning_prompt}]
+            planning_messages = [
+                self._planning_message(),
+                {"role": "user", "content": f"Task: {task_description}"}
+            ]
             response = self.get_llm_response(planning_messages, json_mode=True)
 
             # Parse JSON response
-            steps = json.loads(response)
+            steps = json_loads(response)
             # Ensure steps is a list of dictionaries
             if isinstance(steps, list):
                 # Validate each step is a dictionary
@@ -247,14 +706,27 @@ class Agent:
                             "description": str(step),
                             "requires_tool": False
                         })
-                return valid_steps
+                return valid_steps, _templatize_plan(valid_steps, numbers)
             else:
                 # If steps is not a list, create a default plan
-                return [{"step": 1, "description": "Process the user's request", "requires_tool": False}]
+                return [{"step": 1, "description": "Process the user's request", "requires_tool": False}], None
         except Exception as e:
             print(f"Error parsing plan: {e}")
             # If we can't parse the response, create a simple plan based on the task
-            return [{"step": 1, "description": f"Process the request: {task_description}", "requires_tool": False}]
+            return [{"step": 1, "description": f"Process the request: {task_description}", "requires_tool": False}], None
+
+    @staticmethod
+    def _local_tool_parameters(step: Dict[str, Any], tool_name: str) -> Optional[Dict[str, Any]]:
+        """Get the parameters for a step that doesn't need the LLM, or None."""
+        # Check if the step already has parameters defined
+        if tool_name == "calculator" and "expression" in step:
+            return {"expression": step["expression"]}
+
+        # For time-related queries, default to local timezone
+        if tool_name == "get_current_time":
+            return {"timezone": "local"}
+
+        return None
 
     def determine_tool_parameters(self, step: Dict[str, Any], tool_name: str) -> Dict[str, Any]:
         """
@@ -267,55 +739,36 @@ class Agent:
         Returns:
             A dictionary of parameters for the tool
         """
-        # Check if the step already has parameters defined
-        if tool_name == "calculator" and "expression" in step:
-            return {"expression": step["expression"]}
-
-        # For time-related queries, default to local timezone
-        if tool_name == "get_current_time":
-            return {"timezone": "local"}
+        parameters = self._local_tool_parameters(step, tool_name)
+        if parameters is not None:
+            return parameters
 
         # For other cases, use the LLM to determine parameters
         step_description = step["description"]
 
-        # Get the tool's parameter descriptions
-        tool = self.tool_registry.get_tool(tool_name)
-        parameters_json = json.dumps(tool["parameters"], indent=2)
-
-        # Create a prompt to determine the parameters
-        prompt = f"""
-        For the following step in a task:
-        "{step_description}"
-
-        I need to use the "{tool_name}" tool, which has these parameters:
-        {parameters_json}
-
-        Please determine the appropriate values for these parameters based on the step description.
-        Return a JSON object with the parameter names as keys and their values.
-        """
-
         try:
-            messages = [{"role": "user", "content": prompt}]
+            messages = [
+                self._parameters_message(tool_name),
+                {"role": "user", "content": f'Step: "{step_description}"'}
+            ]
             response = self.get_llm_response(messages, json_mode=True)
 
-            parameters = json.loads(response)
+            parameters = json_loads(response)
             return parameters
         except Exception as e:
             print(f"Error determining parameters: {e}")
             # If we can't parse the response, return default parameters based on the tool
             if tool_name == "calculator":
                 # Try to extract a calculation from the description
-                import re
                 # Look for patterns like "2 + 2" or "square of 99"
-                match = re.search(r'\d+\s*[+\-*/^]\s*\d+', step_description)
+                match = EXPR_RE.search(step_description)
                 if match:
                     return {"expression": match.group(0)}
 
-                if "square of" in step_description.lower():
-                    numbers = re.findall(r'\d+', step_description)
-                    if numbers:
-                        num = numbers[0]
-                        return {"expression": f"{num} * {num}"}
+                square = SQUARE_RE.search(step_description.lower())
+                if square:
+                    num = square.group(1)
+                    return {"expression": f"{num} * {num}"}
 
                 return {"expression": "2 + 2"} # Default fallback
 
@@ -325,12 +778,92 @@ class Agent:
             else:
                 return {}
 
-    def execute_step(self, step: Dict[str, Any]) -> str:
+    def determine_all_tool_parameters(self, plan: List[Dict[str, Any]],
+                                      start: int = 0) -> Dict[int, Dict[str, Any]]:
+        """
+        Determine the tool parameters for every tool-using step of a plan at once.
+
+        Steps whose parameters aren't known locally are sent to the LLM in a
+        single request, so a plan with several tool steps costs one LLM
+        round-trip instead of one per step. If that response can't be used,
+        the steps fall back to separate lookups, run concurrently.
+
+        Args:
+            plan: The steps of the plan
+            start: Index of the first step that still needs parameters
+
+        Returns:
+            A dictionary mapping step indexes to their tool parameters
+        """
+        all_parameters = {}
+        llm_steps = []
+        for i, step in enumerate(plan):
+            if i < start or not step.get("requires_tool", False) or "tool_name" not in step:
+                continue
+            parameters = self._local_tool_parameters(step, step["tool_name"])
+            if parameters is not None:
+                all_parameters[i] = parameters
+            else:
+                llm_steps.append((i, step))
+
+        if len(llm_steps) > 1:
+            all_parameters.update(self._determine_parameters_batch(llm_steps))
+            llm_steps = [(i, step) for i, step in llm_steps if i not in all_parameters]
+
+        futures = {
+            i: self._pool.submit(self.determine_tool_parameters, step, step["tool_name"])
+            for i, step in llm_steps
+        }
+        all_parameters.update({i: future.result() for i, future in futures.items()})
+        return all_parameters
+
+    def _determine_parameters_batch(self, steps: List[tuple]) -> Dict[int, Dict[str, Any]]:
+        """
+        Ask the LLM for the parameters of several tool steps in one request.
+
+        Args:
+            steps: (plan index, step) pairs that need parameters
+
+        Returns:
+            A dictionary mapping plan indexes to parameters, for the steps
+            the response covered; empty if the response couldn't be parsed
+        """
+        tool_names = sorted({step["tool_name"] for _, step in steps})
+        tools_section = "\n\n".join(
+            f'The "{tool_name}" tool has these parameters:\n'
+            f"{self.tool_registry.parameters_text(tool_name)}"
+            for tool_name in tool_names
+        )
+        steps_section = "\n".join(
+            f'{i + 1}. [{step["tool_name"]}] "{step["description"]}"' for i, step in steps
+        )
+
+        messages = [
+            BATCH_PARAMETERS_MESSAGE,
+            {"role": "user", "content": f"{tools_section}\n\nSteps:\n{steps_section}"}
+        ]
+        try:
+            response = self.get_llm_response(messages, json_mode=True)
+            result = json_loads(response)
+        except (LLMError, ValueError) as e:
+            print(f"Error determining parameters: {e}")
+            return {}
+        if not isinstance(result, dict):
+            return {}
+
+        return {
+            i: result[str(i + 1)] for i, _ in steps
+            if isinstance(result.get(str(i + 1)), dict)
+        }
+
+    def execute_step(self, step: Dict[str, Any],
+                     parameters: Optional[Dict[str, Any]] = None) -> str:
         """
         Execute a step in the plan.
 
         Args:
             step: The step to execute
+            parameters: Tool parameters determined in advance, if any
 
         Returns:
             The result of executing the step
@@ -338,7 +871,8 @@ class Agent:
         if step.get("requires_tool", False) and "tool_name" in step:
             # Execute the tool
             tool_name = step["tool_name"]
-            parameters = self.determine_tool_parameters(step, tool_name)
+            if parameters is None:
+                parameters = self.determine_tool_parameters(step, tool_name)
 
             try:
                 result = self.tool_registry.execute_tool(tool_name, **parameters)
@@ -361,27 +895,89 @@ class Agent:
                 print(f"Error executing step with LLM: {e}")
                 # Provide a direct response if LLM fails
                 if "time" in step["description"].lower():
-                    import datetime
                     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     return f"The current time is {current_time}"
                 elif "square" in step["description"].lower():
-                    import re
-                    numbers = re.findall(r'\d+', step["description"])
+                    numbers = NUM_RE.findall(step["description"])
                     if numbers:
                         num = int(numbers[0])
                         return f"The square of {num} is {num * num}"
                 return f"Completed step: {step['description']}"
 
-    def generate_task_summary(self) -> str:
+    def execute_plan(self, plan: List[Dict[str, Any]],
+                     all_parameters: Dict[int, Dict[str, Any]],
+                     first_step: Optional[Future] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Execute a plan, running steps that don't depend on each other concurrently.
+
+        A step can list the step numbers it needs in "depends_on"; steps
+        without it are independent. Steps run in waves: every step whose
+        dependencies are done is started at once on the agent's thread pool,
+        so independent steps take as long as the slowest of them rather
+        than the sum.
+
+        Args:
+            plan: The steps of the plan
+            all_parameters: Tool parameters determined in advance, by step index
+            first_step: A future already running the first step, if any
+
+        Yields:
+            (step index, result) pairs, in plan order within each wave
+        """
+        # Plans come from the LLM, so step numbers and dependencies that
+        # aren't integers are ignored: such a step gets its position as its
+        # number, or no dependencies
+        def is_int(value: Any) -> bool:
+            return isinstance(value, int) and not isinstance(value, bool)
+
+        index_by_number = {}
+        for i, step in enumerate(plan):
+            number = step.get("step")
+            index_by_number[number if is_int(number) else i + 1] = i
+        dependencies = []
+        for i, step in enumerate(plan):
+            depends_on = step.get("depends_on")
+            if not isinstance(depends_on, list):
+                depends_on = []
+            dependencies.append({
+                index_by_number[number] for number in depends_on
+                if is_int(number) and number in index_by_number and index_by_number[number] != i
+            })
+
+        remaining = list(range(len(plan)))
+        done = set()
+        while remaining:
+            ready = [i for i in remaining if dependencies[i] <= done]
+            if not ready:
+                # Circular dependencies: run what's left in plan order
+                ready = remaining
+
+            futures = {}
+            for i in ready:
+                if i == 0 and first_step is not None:
+                    futures[i] = first_step
+                else:
+                    futures[i] = self._pool.submit(self.execute_step, plan[i], all_parameters.get(i))
+
+            for i in ready:
+                yield i, futures[i].result()
+                done.add(i)
+            remaining = [i for i in remaining if i not in done]
+
+    def generate_task_summary(self, stream: bool = False) -> Union[str, Iterator[str]]:
         """
         Generate a summary of the completed task.
 
+        Args:
+            stream: Whether to return an iterator over the summary as it is generated
+
         Returns:
-            A summary of the task execution
+            A summary of the task execution, or an iterator over its pieces
+            if stream is True
         """
         # Create a summary of the plan and results
-        plan_json = json.dumps(self.state["current_plan"], indent=2)
-        results_json = json.dumps(self.state["collected_information"], indent=2)
+        plan_json = json_dumps(self.state["current_plan"], indent=True).decode("utf-8")
+        results_json = json_dumps(self.state["collected_information"], indent=True).decode("utf-8")
 
         summary_prompt = f"""
         I've completed a task with the following plan:
@@ -394,7 +990,7 @@ class Agent:
         """
 
         summary_messages = [{"role": "user", "content": summary_prompt}]
-        summary = self.get_llm_response(summary_messages)
+        summary = self.get_llm_response(summary_messages, stream=stream)
 
         return summary
 
@@ -410,26 +1006,75 @@ class Agent:
         Returns:
             The agent's response
         """
-        # Initialize conversation with a system message if it's empty
-        if not self.state["conversation"]:
-            system_message = {
-                "role": "system",
-                "content": "You are an AI assistant with access to tools. You can perform tasks like calculating math expressions and telling the current time. Always use your tools when appropriate instead of making up answers."
-            }
-            self.state["conversation"].append(system_message)
+        return "".join(self.process_user_input_stream(user_input))
+
+    def process_user_input_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Process user input and yield the response piece by piece.
 
+        The plan is yielded as soon as it is ready, each step's result as soon
+        as the step finishes, and LLM-written text (the summary, or the answer
+        to a question) token by token as it is generated, so callers can show
+        output long before the whole response is complete.
+
+        Args:
+            user_input: The user's input
+
+        Yields:
+            Successive pieces of the agent's response
+        """
         # Add the user input to the conversation
         self.add_message_to_conversation("user", user_input)
 
-        # Determine if this is a task request or a question
-        is_task = self.determine_if_task(user_input)
+        # Answer trivial requests locally, without calling the LLM
+        lower_input = user_input.lower().strip()
+        for pattern, handler in FAST_PATHS:
+            match = pattern.fullmatch(lower_input)
+            if match:
+                response = handler(match)
+                self.add_message_to_conversation("assistant", response)
+                yield response
+                return
+
+        # Answer near-duplicates of earlier questions from the semantic cache
+        vector = None
+        if self._embedder is not None:
+            vector = self._embed(user_input)
+            cached = self._semantic_lookup(vector)
+            if cached is not None:
+                self.add_message_to_conversation("assistant", cached)
+                yield cached
+                return
+
+        # If this input has been planned before, its first step is probably
+        # the same again: start running it while the task check is in flight.
+        # Only tool steps are run early, since they're cheap and have no
+        # side effects; the result is thrown away if the guess was wrong.
+        predicted_plan = self._cached_plan(user_input)
+        speculative = None
+        if predicted_plan and predicted_plan[0].get("requires_tool", False):
+            speculative = self._pool.submit(self.execute_step, predicted_plan[0])
+
+        # Deciding whether this is a task and planning it don't depend on
+        # each other, so run both at once; a task then waits for the slower
+        # of the two instead of both in turn. The plan is only cached once
+        # the input is confirmed to be a task.
+        task_check = self._pool.submit(self.determine_if_task, user_input)
+        planning = self._pool.submit(self._plan_task, user_input)
+        is_task = task_check.result()
+
+        # Everything yielded, joined into the full response at the end
+        pieces = []
 
         if is_task:
             # Task handling path
             response = "I'll help you complete this task. Let me break it down into steps.\n\n"
 
-            # Plan the task
-            self.state["current_plan"] = self.plan_task(user_input)
+            # Collect the plan
+            plan, template = planning.result()
+            if template is not None:
+                self._plan_cache[_task_signature(user_input)] = template
+            self.state["current_plan"] = plan
             self.state["current_step_index"] = 0
             self.state["task_completed"] = False
             self.state["collected_information"] = {}
@@ -442,43 +1087,80 @@ class Agent:
                 response += f"- Step {step_num}: {description}\n"
 
             response += "\nI'll start working on this task. I'll let you know when I'm done."
+            response += "\n\nHere are the results of each step:\n"
+            pieces.append(response)
+            yield response
 
-            # Execute the plan step by step
-            step_results = []
-            for i, step in enumerate(self.state["current_plan"]):
-                self.state["current_step_index"] = i
+            # Keep the speculative first step only if the plan starts the same way
+            if speculative is not None and self.state["current_plan"][0] != predicted_plan[0]:
+                speculative.cancel()
+                speculative = None
+
+            # Work out the tool parameters for all other steps concurrently
+            all_parameters = self.determine_all_tool_parameters(
+                self.state["current_plan"], start=1 if speculative else 0)
 
-                step_result = self.execute_step(step)
-                step_results.append(step_result)
+            # Execute the plan, showing each result as it's ready
+            for i, step_result in self.execute_plan(self.state["current_plan"],
+                                                    all_parameters, speculative):
+                self.state["current_step_index"] = i
 
                 # Store the result
                 self.state["collected_information"][f"step_{i+1}"] = step_result
+                self._compact_memory("collected_information")
+
+                step = self.state["current_plan"][i]
+                description = step.get('description', f'Step {i+1}')
+                response = f"\nStep {i+1}: {description}\nResult: {step_result}\n"
+                pieces.append(response)
+                yield response
 
             # Mark the task as completed
             self.state["task_completed"] = True
 
-            # Generate a summary
-            summary = self.generate_task_summary()
-
-            # Add the results to the response
-            response += "\n\nHere are the results of each step:\n"
-            for i, result in enumerate(step_results):
-                step = self.state['current_plan'][i]
-                description = step.get('description', f'Step {i+1}')
-                response += f"\nStep {i+1}: {description}\n"
-                response += f"Result: {result}\n"
-
-            response += f"\n\nTask completed! Summary:\n{summary}"
+            # Stream the summary
+            response = "\n\nTask completed! Summary:\n"
+            pieces.append(response)
+            yield response
+            try:
+                for chunk in self.generate_task_summary(stream=True):
+                    pieces.append(chunk)
+                    yield chunk
+            except LLMError as e:
+                response = f"I encountered an error when trying to summarize the task: {e}"
+                pieces.append(response)
+                yield response
         else:
+            # Not a task after all, so the plan and speculative step aren't needed
+            planning.cancel()
+            if speculative is not None:
+                speculative.cancel()
+
             # Standard chatbot path for questions
-            messages = self.state["conversation"].copy()
-            response = self.get_llm_response(messages)
+            # The conversation is sent as it is, without copying, once it
+            # has been trimmed to the history budget
+            self._trim_history()
+            messages = self.state["conversation"]
+            failed = False
+            try:
+                for chunk in self.get_llm_response(messages, stream=True):
+                    pieces.append(chunk)
+                    yield chunk
+            except LLMError as e:
+                failed = True
+                response = f"I encountered an error when trying to process your request: {e}"
+                pieces.append(response)
+                yield response
+            response = "".join(pieces)
+
+            # Only question answers are cached; task results such as the
+            # current time go stale
+            if vector is not None and not failed:
+                self._sem_index.add(vector)
+                self._sem_store.append((time.time(), user_input, response))
 
         # Add the response to the conversation
-        self.add_message_to_conversation("assistant", response)
-
-        return response
-
+        self.add_message_to_conversation("assistant", "".join(pieces))
 
 if __name__ == "__main__":
     # Test the agent
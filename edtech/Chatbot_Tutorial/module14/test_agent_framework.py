@@ -0,0 +1,56 @@
+"""Tests for learning and reusing plan templates."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from agent_framework import NUM_RE, Agent, _fill_plan, _templatize_plan
+
+
+def _numbers(task):
+    return NUM_RE.findall(task.lower())
+
+
+def test_template_is_filled_with_the_new_numbers():
+    plan = [{"step": 1, "description": "Multiply 12 by 7, then add 5", "expression": "12 * 7 + 5"}]
+    template = _templatize_plan(plan, _numbers("12 times 7 plus 5"))
+
+    filled = _fill_plan(template, _numbers("3 times 40 plus 10"))
+
+    assert filled == [{"step": 1, "description": "Multiply 3 by 40, then add 10", "expression": "3 * 40 + 10"}]
+
+
+def test_numbers_inside_placeholders_are_not_replaced():
+    plan = [{"step": 1, "description": "Divide 5 by 0 and 1"}]
+    template = _templatize_plan(plan, _numbers("5 over 0 and 1"))
+
+    assert template == [{"step": 1, "description": "Divide <N0> by <N1> and <N2>"}]
+
+
+def test_plan_for_task_with_repeated_number_is_not_templated():
+    plan = [{"step": 1, "description": "Multiply 12 by 12, then add 5", "expression": "12 * 12 + 5"}]
+
+    assert _templatize_plan(plan, _numbers("12 times 12 plus 5")) is None
+
+
+class _StubAgent(Agent):
+    """An agent whose steps just report their description, without an LLM."""
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        self._http = requests.Session()
+
+    def execute_step(self, step, parameters=None):
+        return step["description"]
+
+
+def test_malformed_step_numbers_and_dependencies_are_ignored():
+    plan = [
+        {"step": [1], "description": "a", "depends_on": 2},
+        {"step": 2, "description": "b", "depends_on": [[1], "1", True]},
+        {"step": "3", "description": "c", "depends_on": [1]},
+    ]
+
+    results = dict(_StubAgent().execute_plan(plan, {}))
+
+    assert results == {0: "a", 1: "b", 2: "c"}
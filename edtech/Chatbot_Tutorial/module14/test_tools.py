@@ -0,0 +1,31 @@
+"""Tests for the calculator's expression evaluator."""
+
+import pytest
+
+from tools import _evaluate
+
+
+def test_evaluates_arithmetic():
+    assert _evaluate("2 ** 10 + 3 * 4") == 1036
+
+
+@pytest.mark.parametrize("expression", ["10 ** 1000", "10 ** 30000", "1 ** 200000", "(-1) ** 200001"])
+def test_allows_large_but_bounded_results(expression):
+    assert _evaluate(expression) == eval(expression)
+
+
+def test_functions_still_take_lists():
+    assert _evaluate("max([1, 5, 3]) + sum((1, 2))") == 8
+
+
+@pytest.mark.parametrize("expression", [
+    "9 ** 9 ** 9",
+    "(10 ** 10000) ** 10000",
+    "2 ** 200000",
+    "(10 ** 20000) * (10 ** 20000)",
+    "[0] * 10 ** 10",
+    "sum([1] * 10 ** 10)",
+])
+def test_rejects_results_too_large_to_compute(expression):
+    with pytest.raises(ValueError):
+        _evaluate(expression)
@@ -5,9 +5,12 @@ This module provides a collection of tools that can be used by the agent to inte
 with external systems and perform specific tasks.
 """
 
+import ast
 import json
 import math
+import operator
 import datetime
+import functools
 import requests
 from typing import Dict, Any, List, Callable, Optional
 
@@ -16,6 +19,13 @@ class ToolRegistry:
 
     def __init__(self):
         self.tools: Dict[str, Dict[str, Any]] = {}
+        # Tool functions by name, for dispatch with a single lookup
+        self._funcs: Dict[str, Callable] = {}
+        # The list_tools() result, rebuilt only when a tool is registered
+        self._tool_list_cache: List[Dict[str, Any]] = []
+        # Serialized tool descriptions for prompts, built on first use
+        self._tools_text_cache: Optional[str] = None
+        self._parameters_text_cache: Dict[str, str] = {}
 
     def register_tool(self, name: str, description: str, function: Callable,
                       parameters: Optional[List[Dict[str, Any]]] = None):
@@ -33,6 +43,17 @@ class ToolRegistry:
             "function": function,
             "parameters": parameters or []
         }
+        self._funcs[name] = function
+        self._tool_list_cache = [
+            {
+                "name": tool_name,
+                "description": tool["description"],
+                "parameters": tool["parameters"]
+            }
+            for tool_name, tool in self.tools.items()
+        ]
+        self._tools_text_cache = None
+        self._parameters_text_cache.pop(name, None)
 
     def get_tool(self, name: str) -> Dict[str, Any]:
         """Get a tool by name."""
@@ -42,14 +63,43 @@ class ToolRegistry:
 
     def list_tools(self) -> List[Dict[str, Any]]:
         """Get a list of all available tools with their descriptions."""
-        return [
-            {
-                "name": name,
-                "description": tool["description"],
-                "parameters": tool["parameters"]
-            }
-            for name, tool in self.tools.items()
-        ]
+        return self._tool_list_cache
+
+    def tools_text(self) -> str:
+        """
+        Get all tools described for a prompt.
+
+        Each tool is one compact line, e.g. "- calculator(expression: string) - Perform mathematical
+        calculations", which carries the same information as pretty-printed
+        JSON in far fewer tokens. Tools are sorted by name so the text is the same
+        on every call. The result is cached until another tool is registered.
+        """
+        if self._tools_text_cache is None:
+            tools = sorted(self.list_tools(), key=lambda tool: tool["name"])
+            self._tools_text_cache = "\n".join(
+                f"- {tool['name']}("
+                + ", ".join(f"{p['name']}: {p['type']}" for p in tool["parameters"])
+                + f") - {tool['description']}"
+                for tool in tools
+            )
+        return self._tools_text_cache
+
+    def parameters_text(self, name: str) -> str:
+        """
+        Get a tool's parameters described for a prompt, one per line.
+
+        Each parameter is one compact line, e.g.
+        "- expression (string): The mathematical expression to evaluate".
+        The result is cached per tool.
+        """
+        parameters_text = self._parameters_text_cache.get(name)
+        if parameters_text is None:
+            parameters_text = "\n".join(
+                f"- {p['name']} ({p['type']}): {p['description']}"
+                for p in self.get_tool(name)["parameters"]
+            )
+            self._parameters_text_cache[name] = parameters_text
+        return parameters_text
 
     def execute_tool(self, name: str, **kwargs) -> Any:
         """
@@ -61,19 +111,106 @@ class ToolRegistry:
 
         Returns:
             The result of the tool execution
+
+        Raises:
+            ValueError: If the tool is not registered
+            Exception: Whatever the tool function raises is passed on to the caller
         """
-        if name not in self.tools:
+        function = self._funcs.get(name)
+        if function is None:
             raise ValueError(f"Tool '{name}' not found in registry")
-
-        try:
-            result = self.tools[name]["function"](**kwargs)
-            return result
-        except Exception as e:
-            return f"Error executing tool '{name}': {str(e)}"
+        return function(**kwargs)
 
 
 # Define some example tools
 
+# Operators, functions and constants the calculator understands
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg
+}
+
+_FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "max": max,
+    "min": min,
+    "sum": sum,
+    "sqrt": math.sqrt,
+    "pow": math.pow,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan
+}
+
+_CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e
+}
+
+# Largest integer result allowed, in bits (a little over 30,000 decimal
+# digits), so "9 ** 9 ** 9" or "(10 ** 10000) ** 10000" can't hang the
+# agent. Float arithmetic overflows quickly on its own, so only integers are
+# checked.
+_MAX_RESULT_BITS = 100_000
+
+
+def _check_result_size(op: ast.operator, left: Any, right: Any) -> None:
+    """Refuse integer powers and products whose result would be too large to compute."""
+    if not (isinstance(left, int) and isinstance(right, int)):
+        return
+    if isinstance(op, ast.Pow) and right > 0:
+        # Powers of 0, 1 and -1 never grow
+        bits = math.log2(abs(left)) * right if abs(left) > 1 else 0
+    elif isinstance(op, ast.Mult):
+        bits = left.bit_length() + right.bit_length()
+    else:
+        return
+    if bits > _MAX_RESULT_BITS:
+        raise ValueError("result is too large")
+
+
+def _eval_node(node: ast.AST) -> Any:
+    """Evaluate one node of a parsed expression, allowing only arithmetic."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left = _eval_node(node.left)
+        right = _eval_node(node.right)
+        # Operators apply to numbers only: "[0] * 10 ** 10" would otherwise
+        # build a huge list
+        if not (isinstance(left, (int, float)) and isinstance(right, (int, float))):
+            raise ValueError("operators only apply to numbers")
+        _check_result_size(node.op, left, right)
+        return _BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_eval_node(node.operand))
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in _FUNCTIONS and not node.keywords):
+        return _FUNCTIONS[node.func.id](*(_eval_node(arg) for arg in node.args))
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_eval_node(element) for element in node.elts]
+    raise ValueError(f"unsupported syntax: {ast.dump(node)}")
+
+
+@functools.lru_cache(maxsize=1024)
+def _evaluate(expression: str) -> Any:
+    """Parse and evaluate an arithmetic expression, caching results by expression."""
+    return _eval_node(ast.parse(expression, mode="eval").body)
+
+
 def calculator(expression: str) -> float:
     """
     Evaluate a mathematical expression.
@@ -107,25 +244,10 @@ def calculator(expression: str) -> float:
     # Replace common math functions with their math module equivalents
     expression = expression.replace("^", "**")
 
-    # Create a safe local environment with only math functions
-    safe_locals = {
-        "abs": abs,
-        "round": round,
-        "max": max,
-        "min": min,
-        "sum": sum,
-        "sqrt": math.sqrt,
-        "pow": math.pow,
-        "sin": math.sin,
-        "cos": math.cos,
-        "tan": math.tan,
-        "pi": math.pi,
-        "e": math.e
-    }
-
     try:
-        # Evaluate the expression in the safe environment
-        result = eval(expression, {"__builtins__": {}}, safe_locals)
+        # Evaluate the parsed expression; only numbers, arithmetic and the
+        # math functions above are allowed, so no arbitrary code can run
+        result = _evaluate(expression.strip())
         return result
     except Exception as e:
         raise ValueError(f"Invalid expression: {str(e)}")
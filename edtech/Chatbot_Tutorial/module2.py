@@ -1,7 +1,41 @@
 import requests
 import os
+import json
+import hashlib
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+# orjson encodes and decodes JSON several times faster than json; fall back
+# to json if it isn't installed. json_dumps returns UTF-8 bytes either way.
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return json.dumps(obj, sort_keys=sort_keys).encode("utf-8")
+
+# tiktoken counts tokens the way the models do; without it, or when its
+# encoding can't be downloaded (e.g. offline on first run), tokens are
+# estimated at four characters each
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+def count_tokens(text):
+    """Return the number of tokens in text."""
+    if _ENCODING is None:
+        return len(text) // 4
+    return len(_ENCODING.encode(text))
+
 
 load_dotenv()
 
@@ -9,6 +43,12 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY environment variable. Please set it in your .env file.")
 
+# Connect and read timeouts for API calls
+GROQ_TIMEOUT = (3.05, 60)
+
+# Most tokens of history sent to the API with each message
+MAX_HISTORY_TOKENS = 6000
+
 class GroqChatbot:
     def __init__(self, api_key, model="llama3-70b-8192"):
         """
@@ -24,10 +64,37 @@ class GroqChatbot:
             {"role": "system", "content": "You are a helpful AI assistant."}
         ]
         self.url = "https://api.groq.com/openai/v1/chat/completions"
-        self.headers = {
+        # Reuse one connection across turns instead of a new TLS handshake per message
+        self.session = requests.Session()
+        self.session.headers.update({
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
-        }
+        })
+        # Answers keyed by model + full history, so a repeated conversation costs no API call
+        self.response_cache = TTLCache(maxsize=1024, ttl=3600)
+    
+    def trimmed_history(self, max_tokens=MAX_HISTORY_TOKENS):
+        """
+        Get the most recent part of the conversation that fits a token budget.
+        
+        The system message and the latest user message are always kept, and
+        older messages are dropped in user/assistant pairs. The full history
+        is left untouched for display.
+        
+        Args:
+            max_tokens (int): The most tokens the returned messages may use
+            
+        Returns:
+            list: The messages to send to the API
+        """
+        history = self.conversation_history
+        tokens = [count_tokens(message["content"]) for message in history]
+        total = sum(tokens)
+        cut = 1
+        while total > max_tokens and cut < len(history) - 2:
+            total -= tokens[cut] + tokens[cut + 1]
+            cut += 2
+        return history[:1] + history[cut:]
     
     def send_message(self, message):
         """
@@ -42,23 +109,32 @@ class GroqChatbot:
         # Add user message to history
         self.conversation_history.append({"role": "user", "content": message})
         
-        # Prepare request body
+        # Prepare request body with only as much history as fits the budget
+        messages = self.trimmed_history()
         data = {
             "model": self.model,
-            "messages": self.conversation_history,
+            "messages": messages,
             "temperature": 0.7,
             "max_tokens": 1024
         }
         
+        # Serve repeated conversations from the cache
+        key = hashlib.sha1(json_dumps([self.model, messages], sort_keys=True)).hexdigest()
+        assistant_message = self.response_cache.get(key)
+        if assistant_message is not None:
+            self.conversation_history.append({"role": "assistant", "content": assistant_message})
+            return assistant_message
+        
         try:
             
-            response = requests.post(self.url, headers=self.headers, json=data)
+            response = self.session.post(self.url, data=json_dumps(data), timeout=GROQ_TIMEOUT)
             
             response.raise_for_status()
             
-            result = response.json()
+            result = json_loads(response.content)
             
             assistant_message = result["choices"][0]["message"]["content"]
+            self.response_cache[key] = assistant_message
             
             # Add assistant response to history-The extra step
             self.conversation_history.append({"role": "assistant", "content": assistant_message})
@@ -82,14 +158,18 @@ class GroqChatbot:
         self.model = new_model
         return f"Model changed to {new_model}."
     
+    def close(self):
+        """Close the underlying HTTP session."""
+        self.session.close()
+    
     def display_history(self):
         """Display the conversation history."""
-        history = ""
-        for message in self.conversation_history:
-            if message["role"] != "system":
-                role = "You" if message["role"] == "user" else "AI"
-                history += f"{role}: {message['content']}\n\n"
-        return history
+        parts = [
+            f"{'You' if message['role'] == 'user' else 'AI'}: {message['content']}\n\n"
+            for message in self.conversation_history
+            if message["role"] != "system"
+        ]
+        return "".join(parts)
 
 def main():
     """Run the chatbot in a command-line interface."""
@@ -100,24 +180,49 @@ def main():
     print("Type 'exit' to quit, 'clear' to clear conversation history, 'history' to view conversation history.")
     print("Type 'model:model_name' to change the model (e.g., 'model:llama3-8b-8192').")
     
+    try:
+        _chat_loop(chatbot)
+    finally:
+        chatbot.close()
+
+def _exit(chatbot):
+    """Say goodbye and stop the chat loop."""
+    print("Goodbye!")
+    return True
+
+def _clear(chatbot):
+    """Clear the conversation history."""
+    print(chatbot.clear_history())
+
+def _history(chatbot):
+    """Print the conversation history."""
+    print("\nConversation History:")
+    print(chatbot.display_history())
+
+# Special commands, looked up by the lower-cased input. A handler returns
+# True to end the chat.
+COMMANDS = {
+    "exit": _exit,
+    "clear": _clear,
+    "history": _history
+}
+
+def _chat_loop(chatbot):
+    """Read user input and dispatch commands until the user exits."""
     while True:
         user_input = input("\nYou: ").strip()
+        command = user_input.lower()
         
         # Check for special commands
-        if user_input.lower() == 'exit':
-            print("Goodbye!")
-            break
-        elif user_input.lower() == 'clear':
-            print(chatbot.clear_history())
-            continue
-        elif user_input.lower() == 'history':
-            print("\nConversation History:")
-            print(chatbot.display_history())
-            continue
-        elif user_input.lower().startswith('model:'):
+        if command.startswith('model:'):
             new_model = user_input[6:].strip()
             print(chatbot.change_model(new_model))
             continue
+        handler = COMMANDS.get(command)
+        if handler:
+            if handler(chatbot):
+                break
+            continue
         
         # Get response from chatbot
         print("\nAI is thinking...")
@@ -1,9 +1,65 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
-import uuid
+import secrets
+import json
+import hashlib
+import threading
+from concurrent.futures import Future
+from cachetools import TTLCache
+
+# orjson encodes and decodes JSON several times faster than json; fall back
+# to json if it isn't installed. json_dumps returns UTF-8 bytes either way.
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider that parses requests and renders jsonify() with orjson."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+except ImportError:
+    json_loads = json.loads
+    OrjsonProvider = None
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return json.dumps(obj, sort_keys=sort_keys).encode("utf-8")
+
+# tiktoken counts tokens the way the models do; without it, or when its
+# encoding can't be downloaded (e.g. offline on first run), tokens are
+# estimated at four characters each
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+def count_tokens(text):
+    """Return the number of tokens in text."""
+    if _ENCODING is None:
+        return len(text) // 4
+    return len(_ENCODING.encode(text))
+
+# Flask-Compress gzips/brotli-encodes larger responses; without it responses
+# are sent uncompressed
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,12 +69,218 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY environment variable. Please set it in your .env file.")
 
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Connect and read timeouts for Groq calls, so a hung connection can't hold
+# a worker thread forever
+GROQ_TIMEOUT = (3.05, 60)
+
+class TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests sent without one."""
+    
+    def __init__(self, *args, timeout=GROQ_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        # requests passes timeout=None when the caller didn't set one
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+# Shared session so every request handler reuses pooled connections to Groq.
+# It is created on first use in each process, so gunicorn workers forked
+# from a preloaded app never share one set of SSL connections.
+_groq_session = None
+_groq_session_pid = None
+_groq_session_lock = threading.Lock()
+
+def groq_session():
+    """Return this process's pooled, retrying session for Groq API calls."""
+    global _groq_session, _groq_session_pid
+    with _groq_session_lock:
+        if _groq_session is None or _groq_session_pid != os.getpid():
+            session = requests.Session()
+            session.headers.update({
+                "Authorization": f"Bearer {GROQ_API_KEY}",
+                "Content-Type": "application/json"
+            })
+            session.mount("https://", TimeoutAdapter(
+                pool_connections=32,
+                pool_maxsize=64,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.2,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["POST"])
+                )
+            ))
+            _groq_session, _groq_session_pid = session, os.getpid()
+        return _groq_session
+
+# Cap on Groq calls in flight across all worker threads, kept below the
+# account's rate limit so bursts queue here instead of coming back as 429s
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", 32))
+groq_slots = threading.BoundedSemaphore(GROQ_CONCURRENCY)
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Dictionary to store conversations for different sessions
-conversations = {}
+# Use orjson for request.json and jsonify() when it's installed
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
+
+# Compress JSON responses of 500+ bytes when the client accepts it. SSE
+# streams are left alone so each chunk reaches the client immediately.
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_LEVEL"] = 4
+app.config["COMPRESS_BR_LEVEL"] = 4
+app.config["COMPRESS_STREAMS"] = False
+if Compress is not None:
+    Compress(app)
+
+class ChatSession:
+    """Everything kept for one session, so it is all evicted together."""
+    
+    def __init__(self):
+        self.history = [{"role": "system", "content": "You are a helpful AI assistant."}]
+        # Messages exchanged (user and assistant), kept up to date on every
+        # turn so /api/sessions doesn't have to scan each history
+        self.message_count = 0
+        # Held for a whole turn so concurrent requests can't interleave the history
+        self.lock = threading.Lock()
+
+# Sessions by ID. Sessions idle for an hour are evicted, and at most 10,000
+# are kept, so abandoned sessions don't pin memory forever. TTLCache isn't
+# thread-safe, so every access holds the lock.
+conversations = TTLCache(maxsize=10_000, ttl=3600)
+conversations_lock = threading.RLock()
+
+# Groq answers keyed by model + conversation; shared by all sessions, so a
+# common opening question is only sent to the API once per hour
+response_cache = TTLCache(maxsize=10_000, ttl=3600)
+response_cache_lock = threading.Lock()
+
+# Most tokens of history kept per session
+MAX_HISTORY_TOKENS = 6000
+
+def trim_history(history, max_tokens=MAX_HISTORY_TOKENS):
+    """
+    Drop the oldest exchanges from a session history until it fits the budget.
+    
+    The system message and the latest user message are always kept, and
+    messages are removed in user/assistant pairs so the roles stay in order.
+    """
+    tokens = [count_tokens(msg["content"]) for msg in history]
+    total = sum(tokens)
+    cut = 1
+    while total > max_tokens and cut < len(history) - 2:
+        total -= tokens[cut] + tokens[cut + 1]
+        cut += 2
+    del history[1:cut]
+
+def get_session(session_id):
+    """
+    Return a session, starting a new one if needed.
+    
+    Storing the session again on every access renews its TTL.
+    """
+    with conversations_lock:
+        session = conversations.get(session_id)
+        if session is None:
+            session = ChatSession()
+        conversations[session_id] = session
+    return session
+
+# Turns currently waiting on Groq, keyed by session and message
+inflight = {}
+inflight_lock = threading.Lock()
+
+def cache_key(model, messages):
+    """Return a stable hash of the model and conversation sent to Groq."""
+    return hashlib.sha1(json_dumps([model, messages], sort_keys=True)).hexdigest()
+
+def run_turn(session_id, message, model):
+    """
+    Add a user message to a session and get the assistant's reply.
+    
+    Args:
+        session_id (str): The session to continue
+        message (str): The user's message
+        model (str): The Groq model to use
+        
+    Returns:
+        str: The assistant's reply
+    """
+    # Turns of one session run one at a time; other sessions proceed in
+    # parallel on their own worker threads while this one waits on Groq
+    session = get_session(session_id)
+    with session.lock:
+        # Get (or start) the conversation history for this session
+        history = session.history
+        
+        # Add user message to conversation history
+        history.append({"role": "user", "content": message})
+        trim_history(history)
+    
+        # Prepare API request to Groq
+        groq_data = {
+            "model": model,
+            "messages": history,
+            "temperature": 0.7,
+            "max_tokens": 1024
+        }
+    
+        # Serve repeated conversations from the cache, otherwise ask Groq
+        key = cache_key(model, history)
+        with response_cache_lock:
+            assistant_message = response_cache.get(key)
+        
+        if assistant_message is None:
+            with groq_slots:
+                response = groq_session().post(GROQ_API_URL, data=json_dumps(groq_data), timeout=GROQ_TIMEOUT)
+            response.raise_for_status()
+            result = json_loads(response.content)
+            
+            # Extract assistant's response
+            assistant_message = result["choices"][0]["message"]["content"]
+            with response_cache_lock:
+                response_cache[key] = assistant_message
+    
+        # Add assistant response to conversation history
+        history.append({"role": "assistant", "content": assistant_message})
+        session.message_count += 2
+    
+    return assistant_message
+
+def single_flight(key, func):
+    """
+    Run func once for concurrent callers that share a key.
+    
+    The first caller runs func; callers arriving while it is still running
+    wait for and return the same result (or exception).
+    """
+    with inflight_lock:
+        future = inflight.get(key)
+        leader = future is None
+        if leader:
+            future = inflight[key] = Future()
+    
+    if not leader:
+        return future.result()
+    
+    try:
+        result = func()
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with inflight_lock:
+            del inflight[key]
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -44,7 +306,7 @@ def chat():
         # Use provided session_id or generate a new one
         session_id = data.get('session_id')
         if not session_id:
-            session_id = str(uuid.uuid4())
+            session_id = secrets.token_hex(16)
             
         # Use provided model or default to llama3-70b-8192
         model = data.get('model', 'llama3-70b-8192')
@@ -52,38 +314,11 @@ def chat():
         if not message:
             return jsonify({"error": "No message provided"}), 400
             
-        # Initialize conversation history for new sessions
-        if session_id not in conversations:
-            conversations[session_id] = [
-                {"role": "system", "content": "You are a helpful AI assistant."}
-            ]
-            
-        # Add user message to conversation history
-        conversations[session_id].append({"role": "user", "content": message})
-        
-        # Prepare API request to Groq
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        groq_data = {
-            "model": model,
-            "messages": conversations[session_id],
-            "temperature": 0.7,
-            "max_tokens": 1024
-        }
-        
-        # Send request to Groq API
-        response = requests.post(url, headers=headers, json=groq_data)
-        response.raise_for_status()
-        result = response.json()
-        
-        # Extract assistant's response
-        assistant_message = result["choices"][0]["message"]["content"]
-        
-        # Add assistant response to conversation history
-        conversations[session_id].append({"role": "assistant", "content": assistant_message})
+        # Identical requests already in flight (double clicks, client retries)
+        # share the first one's answer instead of starting another turn. The
+        # model is part of the key, so a turn never gets another model's answer.
+        turn_key = hashlib.sha1(json_dumps([session_id, model, message])).hexdigest()
+        assistant_message = single_flight(turn_key, lambda: run_turn(session_id, message, model))
         
         # Return response to client
         return jsonify({
@@ -97,6 +332,81 @@ def chat():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    API endpoint that streams the assistant's reply as Server-Sent Events.
+    
+    Takes the same JSON body as /api/chat. Groq's SSE lines are forwarded as
+    they arrive ("data: {...}" chunks ending with "data: [DONE]"), and the
+    session ID is returned in the X-Session-Id header.
+    """
+    data = request.json
+    
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+        
+    message = data.get('message')
+    session_id = data.get('session_id') or secrets.token_hex(16)
+    model = data.get('model', 'llama3-70b-8192')
+    
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+    
+    def generate():
+        session = get_session(session_id)
+        with session.lock:
+            history = session.history
+            history.append({"role": "user", "content": message})
+            trim_history(history)
+            
+            # A cached answer goes out as a single chunk
+            key = cache_key(model, history)
+            with response_cache_lock:
+                assistant_message = response_cache.get(key)
+            if assistant_message is not None:
+                history.append({"role": "assistant", "content": assistant_message})
+                session.message_count += 2
+                chunk = {"choices": [{"delta": {"content": assistant_message}}]}
+                yield b"data: " + json_dumps(chunk) + b"\n\n"
+                yield b"data: [DONE]\n\n"
+                return
+            
+            groq_data = {
+                "model": model,
+                "messages": history,
+                "temperature": 0.7,
+                "max_tokens": 1024,
+                "stream": True
+            }
+            
+            # Forward each line as it arrives and collect the content deltas
+            parts = []
+            try:
+                with groq_slots, groq_session().post(GROQ_API_URL, data=json_dumps(groq_data), stream=True, timeout=GROQ_TIMEOUT) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if line.startswith(b"data: ") and line != b"data: [DONE]":
+                            content = json_loads(line[6:])["choices"][0]["delta"].get("content")
+                            if content:
+                                parts.append(content)
+                        yield line + b"\n"
+            except requests.exceptions.RequestException as e:
+                yield b"data: " + json_dumps({"error": f"API Error: {str(e)}"}) + b"\n\n"
+                return
+            
+            # Add the assembled response to conversation history
+            assistant_message = "".join(parts)
+            history.append({"role": "assistant", "content": assistant_message})
+            session.message_count += 2
+            with response_cache_lock:
+                response_cache[key] = assistant_message
+    
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["X-Session-Id"] = session_id
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 @app.route('/api/clear', methods=['POST'])
 def clear_conversation():
     """
@@ -115,42 +425,51 @@ def clear_conversation():
             return jsonify({"error": "No session ID provided"}), 400
             
         # Clear the conversation history for the session
-        if session_id in conversations:
-            conversations[session_id] = [
-                {"role": "system", "content": "You are a helpful AI assistant."}
-            ]
+        with conversations_lock:
+            session = conversations.get(session_id)
+        if session is not None:
+            with session.lock:
+                del session.history[1:]
+                session.message_count = 0
             
         return jsonify({"status": "success", "message": "Conversation cleared"})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Available models; the list never changes, so its JSON body is built once
+MODELS = [
+    {"id": "llama3-70b-8192", "name": "Llama 3 (70B)"},
+    {"id": "llama3-8b-8192", "name": "Llama 3 (8B)"},
+    {"id": "mixtral-8x7b-32768", "name": "Mixtral 8x7B"},
+    {"id": "gemma-7b-it", "name": "Gemma 7B"}
+]
+MODELS_JSON = json_dumps(MODELS)
+MODELS_ETAG = hashlib.md5(MODELS_JSON).hexdigest()
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """API endpoint to get available models."""
-    # Return list of available models
-    models = [
-        {"id": "llama3-70b-8192", "name": "Llama 3 (70B)"},
-        {"id": "llama3-8b-8192", "name": "Llama 3 (8B)"},
-        {"id": "mixtral-8x7b-32768", "name": "Mixtral 8x7B"},
-        {"id": "gemma-7b-it", "name": "Gemma 7B"}
-    ]
-    return jsonify(models)
+    # Return the pre-serialized list of available models. Clients may cache
+    # it for a day and revalidate with If-None-Match (answered with a 304).
+    response = Response(MODELS_JSON, mimetype="application/json")
+    response.set_etag(MODELS_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
 
 @app.route('/api/sessions', methods=['GET'])
 def get_sessions():
     """API endpoint to get active sessions."""
-    session_list = []
-    for session_id in conversations:
-        # Count messages (excluding system message)
-        message_count = len([msg for msg in conversations[session_id] if msg["role"] != "system"])
-        
-        # Only include sessions with at least one user message
-        if message_count > 0:
-            session_list.append({
-                "id": session_id,
-                "message_count": message_count
-            })
+    with conversations_lock:
+        sessions = list(conversations.items())
+    
+    # Only include sessions with at least one exchange
+    session_list = [
+        {"id": session_id, "message_count": session.message_count}
+        for session_id, session in sessions
+        if session.message_count > 0
+    ]
     
     return jsonify(session_list)
 
@@ -161,6 +480,7 @@ def index():
         "message": "Groq Chatbot API is running",
         "endpoints": [
             {"path": "/api/chat", "method": "POST", "description": "Send a message to the chatbot"},
+            {"path": "/api/chat/stream", "method": "POST", "description": "Send a message and stream the reply (SSE)"},
             {"path": "/api/clear", "method": "POST", "description": "Clear conversation history"},
             {"path": "/api/models", "method": "GET", "description": "Get available models"},
             {"path": "/api/sessions", "method": "GET", "description": "Get active sessions"}
@@ -168,6 +488,9 @@ def index():
     })
 
 if __name__ == '__main__':
+    # Development server. In production run the app under gunicorn instead
+    # (see the Procfile): gunicorn -w 1 -k gthread --threads 32 module3:app
     port = int(os.environ.get('PORT', 5000))
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
     print(f"Starting Groq Chatbot API on port {port}...")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
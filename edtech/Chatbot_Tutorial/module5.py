@@ -1,7 +1,8 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import uuid
+import secrets
 import os
 from dotenv import load_dotenv
 
@@ -20,7 +21,7 @@ st.set_page_config(
 
 # Initialize session state variables
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    st.session_state.session_id = secrets.token_hex(16)
     
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -28,15 +29,48 @@ if "messages" not in st.session_state:
 if "model" not in st.session_state:
     st.session_state.model = "llama3-70b-8192"
 
+# Connect and read timeouts for calls to the Flask backend
+API_TIMEOUT = (2, 60)
+
+class TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests sent without one."""
+    
+    def __init__(self, *args, timeout=API_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        # requests passes timeout=None when the caller didn't set one
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+@st.cache_resource
+def _api_session():
+    """Create one HTTP session shared by every rerun and user of the app"""
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    # Every request gets API_TIMEOUT unless it passes its own
+    adapter = TimeoutAdapter(pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=86400)
+def _load_models():
+    """Fetch available models from the API, cached for a day like the server allows"""
+    response = _api_session().get(f"{API_URL}/api/models", timeout=API_TIMEOUT)
+    response.raise_for_status()
+    models_data = response.json()
+    
+    # Return as dict for streamlit selectbox
+    return {model["name"]: model["id"] for model in models_data}
+
 def fetch_models():
     """Fetch available models from the API"""
+    # Failures aren't cached, so the next rerun tries the API again
     try:
-        response = requests.get(f"{API_URL}/api/models")
-        response.raise_for_status()
-        models_data = response.json()
-        
-        # Return as dict for streamlit selectbox
-        return {model["name"]: model["id"] for model in models_data}
+        return _load_models()
     except Exception as e:
         st.error(f"Error fetching models: {e}")
         return {"Llama 3 (70B)": "llama3-70b-8192"}  # Default fallback
@@ -45,7 +79,7 @@ def fetch_models():
 models_dict = fetch_models()
 
 def chat_with_api(message):
-    """Send message to API and get response"""
+    """Send message to API and yield the response as it streams in"""
     try:
         # Prepare request data
         data = {
@@ -54,17 +88,22 @@ def chat_with_api(message):
             "model": st.session_state.model
         }
         
-        # Send request to API
-        with st.spinner("AI is thinking..."):
-            response = requests.post(f"{API_URL}/api/chat", json=data)
+        # Send request to the streaming endpoint and relay each SSE chunk
+        with _api_session().post(f"{API_URL}/api/chat/stream", json=data, stream=True, timeout=API_TIMEOUT) as response:
             response.raise_for_status()
-            result = response.json()
-        
-        # Extract response
-        return result.get("response", "Sorry, I couldn't process that request.")
+            for line in response.iter_lines():
+                if not line.startswith(b"data: ") or line == b"data: [DONE]":
+                    continue
+                chunk = json.loads(line[6:])
+                if "error" in chunk:
+                    yield f"Error: {chunk['error']}"
+                    return
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
     
     except Exception as e:
-        return f"Error: {str(e)}"
+        yield f"Error: {str(e)}"
 
 def clear_conversation():
     """Clear the conversation history on the API server"""
@@ -75,7 +114,7 @@ def clear_conversation():
         }
         
         # Send request to API
-        response = requests.post(f"{API_URL}/api/clear", json=data)
+        response = _api_session().post(f"{API_URL}/api/clear", json=data, timeout=API_TIMEOUT)
         response.raise_for_status()
         
         # Clear local message history
@@ -131,12 +170,9 @@ def main():
         # Add to session state
         st.session_state.messages.append({"role": "user", "content": prompt})
         
-        # Get AI response
-        response = chat_with_api(prompt)
-        
-        # Display AI response
+        # Stream AI response into the chat as it arrives
         with st.chat_message("assistant"):
-            st.write(response)
+            response = st.write_stream(chat_with_api(prompt))
         
         # Add to session state
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -1,12 +1,65 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, abort
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from dotenv import load_dotenv
 import uuid
 import json
 import time
+import copy
+import hashlib
+import functools
+import gzip
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from cachetools import TTLCache
 from collections import deque
+from itertools import islice
+
+# orjson encodes and decodes JSON several times faster than json; fall back
+# to json if it isn't installed. json_dumps returns UTF-8 bytes either way.
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider that parses requests and renders jsonify() with orjson."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+except ImportError:
+    json_loads = json.loads
+    OrjsonProvider = None
+
+    def json_dumps(obj, sort_keys=False):
+        """Serialize obj to JSON bytes, optionally with sorted keys."""
+        return json.dumps(obj, sort_keys=sort_keys).encode("utf-8")
+
+# Flask-Compress gzips/brotli-encodes larger responses; without it responses
+# are sent uncompressed
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+# tiktoken counts tokens the way the models do; without it, or when its
+# encoding can't be downloaded (e.g. offline on first run), tokens are
+# estimated at four characters each
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,13 +69,183 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY environment variable. Please set it in your .env file.")
 
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Connect and read timeouts for Groq calls, so a hung connection can't hold
+# a session's turn or an executor thread forever
+GROQ_TIMEOUT = (3.05, 60)
+
+class TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests sent without one."""
+    
+    def __init__(self, *args, timeout=GROQ_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        # requests passes timeout=None when the caller didn't set one
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+# Shared session so chat, summary and comparison calls reuse pooled
+# connections to Groq instead of a new TLS handshake per request
+GROQ_SESSION = requests.Session()
+GROQ_SESSION.headers.update({
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+})
+GROQ_SESSION.mount("https://", TimeoutAdapter(pool_connections=32, pool_maxsize=64, max_retries=3))
+
+# Background threads for summaries generated while a turn's main
+# completion is in flight
+GROQ_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="groq")
+
+# Separate threads for the per-model calls of a comparison, so comparisons
+# can't queue ahead of the summaries chat turns wait on
+COMPARE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="compare")
+
+# Longest a chat turn waits for a pending summary before going ahead with the
+# unsummarized history; the summary is swapped in whenever it does finish
+SUMMARY_WAIT_TIMEOUT = 10
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for Groq's requests-per-minute and tokens-per-minute
+    quotas. Callers wait here before sending a request instead of having it
+    rejected with a 429 and retried.
+    """
+    
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """
+        Initialize with full buckets.
+        
+        Args:
+            requests_per_minute (int): Requests allowed per minute
+            tokens_per_minute (int): Tokens allowed per minute
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens):
+        """
+        Block until one request using the given number of tokens may be sent.
+        
+        Args:
+            tokens (int): Estimated tokens for the request (prompt + completion)
+        """
+        # A request larger than a whole minute's budget waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                # Refill both buckets for the time since the last call
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._requests = min(self.requests_per_minute,
+                                     self._requests + elapsed * self.requests_per_minute / 60)
+                self._tokens = min(self.tokens_per_minute,
+                                   self._tokens + elapsed * self.tokens_per_minute / 60)
+                
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                
+                # Sleep until both buckets will have enough
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute
+                )
+            time.sleep(wait)
+
+# Shared across all sessions; set the limits to match your Groq plan
+GROQ_LIMITER = RateLimiter(
+    requests_per_minute=int(os.getenv("GROQ_RPM", 30)),
+    tokens_per_minute=int(os.getenv("GROQ_TPM", 6000))
+)
+
+# Completions of deterministic (temperature 0) requests, shared across
+# sessions. Entries expire after an hour so answers don't go stale forever.
+completion_cache = TTLCache(maxsize=2048, ttl=3600)
+completion_cache_lock = threading.Lock()
+
+def groq_completion(groq_data, estimated_tokens, headers=None):
+    """
+    Send a chat completion request to Groq and return the reply text.
+    
+    Waits for the rate limiter first, and serves repeated temperature-0
+    requests from the completion cache.
+    
+    Args:
+        groq_data (dict): The request body
+        estimated_tokens (int): Expected prompt + completion tokens
+        headers (dict): Extra headers for this request (optional)
+        
+    Returns:
+        str: The assistant's reply
+    """
+    key = None
+    if groq_data.get("temperature") == 0:
+        key = hashlib.blake2b(json_dumps(groq_data, sort_keys=True), digest_size=16).digest()
+        with completion_cache_lock:
+            content = completion_cache.get(key)
+        if content is not None:
+            return content
+    
+    GROQ_LIMITER.acquire(estimated_tokens)
+    response = GROQ_SESSION.post(GROQ_API_URL, headers=headers, data=json_dumps(groq_data))
+    response.raise_for_status()
+    content = json_loads(response.content)["choices"][0]["message"]["content"]
+    
+    if key is not None:
+        with completion_cache_lock:
+            completion_cache[key] = content
+    return content
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Use orjson for request.json and jsonify() when it's installed
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
+
+# Request bodies are small JSON documents; anything larger is refused with a
+# 413 before it is read or parsed
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024
+
+# Compress JSON responses of 500+ bytes (long completions, big session
+# lists) when the client accepts it
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_LEVEL"] = 4
+app.config["COMPRESS_BR_LEVEL"] = 4
+if Compress is not None:
+    Compress(app)
+
+@app.before_request
+def reject_large_bodies():
+    """Refuse oversized bodies up front, outside the handlers' error handling"""
+    if request.content_length is not None and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+        abort(413)
+
 # Dictionary to store conversations with various memory strategies
 conversations = {}
 
+@functools.lru_cache(maxsize=8192)
+def _estimate_tokens(text):
+    """Cached token count; the same contents (system messages especially) recur across sessions"""
+    if _ENCODING is None:
+        return len(text) >> 2
+    # Text that looks like a special token is counted as ordinary text
+    return len(_ENCODING.encode(text, disallowed_special=()))
+
+
 class TokenCounter:
     """Utility class to estimate token counts in messages"""
     
@@ -30,7 +253,8 @@ class TokenCounter:
     def estimate_tokens(text):
         """
         Estimate the number of tokens in a text string.
-        This is a rough estimate: ~4 characters per token for English text.
+        Uses tiktoken's cl100k_base encoding when it is installed, otherwise
+        a rough estimate of ~4 characters per token for English text.
         
         Args:
             text (str): The text to estimate
@@ -38,7 +262,7 @@ class TokenCounter:
         Returns:
             int: Estimated number of tokens
         """
-        return len(text) // 4
+        return _estimate_tokens(text)
     
     @staticmethod
     def count_message_tokens(message):
@@ -74,7 +298,15 @@ class ConversationMemory:
     def __init__(self, system_message="You are a helpful AI assistant."):
         """Initialize with a system message"""
         self.system_message = system_message
-        self.messages = [{"role": "system", "content": system_message}]
+        self._system = {"role": "system", "content": system_message}
+        self._system_tokens = TokenCounter.count_message_tokens(self._system)
+        # Messages after the system message, in deques so the oldest can be
+        # dropped in O(1), with the token count of each kept alongside so the
+        # running total never has to be recomputed from scratch
+        self._set_body([])
+        # Held for a whole chat turn so concurrent requests on one session
+        # can't interleave their messages
+        self.lock = threading.RLock()
         self.created_at = time.time()
         self.last_updated = time.time()
         self.model = "llama3-70b-8192"  # Default model
@@ -85,6 +317,9 @@ class ConversationMemory:
             "frequency_penalty": 0.0,
             "presence_penalty": 0.0
         }
+        # Groq request body, reused across turns until the model or
+        # parameters change
+        self._request_body = None
     
     def add_message(self, role, content):
         """
@@ -94,24 +329,74 @@ class ConversationMemory:
             role (str): Message role (user or assistant)
             content (str): Message content
         """
-        self.messages.append({"role": role, "content": content})
+        self._append_message({"role": role, "content": content})
         self.last_updated = time.time()
     
+    def _set_body(self, messages):
+        """Replace the non-system messages and recount their tokens"""
+        self._body = deque(messages)
+        self._token_sizes = deque(TokenCounter.count_message_tokens(msg) for msg in messages)
+        self._token_total = self._system_tokens + sum(self._token_sizes)
+        self._messages = None
+    
+    def _append_message(self, message):
+        """Append a message and add its tokens to the running total"""
+        tokens = TokenCounter.count_message_tokens(message)
+        self._body.append(message)
+        self._token_sizes.append(tokens)
+        self._token_total += tokens
+        self._messages = None
+    
+    def _pop_oldest(self):
+        """Remove and return the oldest non-system message"""
+        self._token_total -= self._token_sizes.popleft()
+        self._messages = None
+        return self._body.popleft()
+    
+    def _keep_last(self, count):
+        """Keep the system message and the last count messages"""
+        while self.get_message_count() > count:
+            self._pop_oldest()
+    
     def get_messages(self):
         """Return all messages"""
-        return self.messages
+        # Rebuilt only after the conversation has changed
+        if self._messages is None:
+            self._messages = [self._system, *self._body]
+        return self._messages
+    
+    @property
+    def messages(self):
+        """All messages, including the system message"""
+        return self.get_messages()
+    
+    def get_message_count(self):
+        """Get the number of messages, excluding the system message"""
+        return len(self._body)
     
     def clear(self):
         """Clear all messages except system message"""
-        self.messages = [{"role": "system", "content": self.system_message}]
+        self._set_body([])
+    
+    def finish_background_work(self, wait=True):
+        """
+        Apply any work running in the background (none by default).
+        
+        Args:
+            wait (bool): Block until the work is done, for at most
+                SUMMARY_WAIT_TIMEOUT seconds; otherwise only apply work that
+                has already finished
+        """
     
     def get_token_count(self):
         """Get estimated token count of conversation"""
-        return TokenCounter.count_conversation_tokens(self.messages)
+        return self._token_total
     
     def set_model(self, model):
         """Set the model for this conversation"""
-        self.model = model
+        if model != self.model:
+            self.model = model
+            self._request_body = None
         
     def get_model(self):
         """Get the current model"""
@@ -123,16 +408,33 @@ class ConversationMemory:
         for key, value in parameters.items():
             if key in self.parameters:
                 self.parameters[key] = value
+        self._request_body = None
         
     def get_parameters(self):
         """Get the current parameters"""
         return self.parameters
+    
+    def get_request_body(self):
+        """
+        Get the Groq request body for the current conversation.
+        
+        The same dict is returned every turn with only its messages replaced,
+        so it must be sent before the conversation changes again.
+        
+        Returns:
+            dict: The model, messages and parameters
+        """
+        if self._request_body is None:
+            self._request_body = {"model": self.model, "messages": None, **self.parameters}
+        self._request_body["messages"] = self.get_messages()
+        return self._request_body
 
 
 class WindowMemory(ConversationMemory):
     """Conversation memory that keeps a sliding window of messages"""
     
-    def __init__(self, system_message="You are a helpful AI assistant.", window_size=10, max_tokens=4000):
+    def __init__(self, system_message="You are a helpful AI assistant.", window_size=10, max_tokens=4000,
+                 history_limit=1000):
         """
         Initialize with a window size and token limit.
         
@@ -140,21 +442,71 @@ class WindowMemory(ConversationMemory):
             system_message (str): The system message
             window_size (int): Maximum number of messages to keep
             max_tokens (int): Maximum total tokens to maintain
+            history_limit (int): Maximum number of messages kept in the full
+                history; the oldest are dropped beyond it
         """
+        # Needed by _set_body, which the base class calls
+        self.history_limit = history_limit
         super().__init__(system_message)
         self.window_size = window_size
         self.max_tokens = max_tokens
-        self.full_history = []  # Store all messages for reference
+    
+    # Each message is stored once, in full_history; the window is its last
+    # _window_len messages, so trimming only shrinks the count
+    
+    def _set_body(self, messages):
+        """Replace the history with messages, all of them in the window"""
+        # Store recent messages for reference, dropping the oldest past the limit
+        self.full_history = deque(messages, maxlen=self.history_limit)
+        self._history_sizes = deque((TokenCounter.count_message_tokens(msg) for msg in self.full_history),
+                                    maxlen=self.history_limit)
+        self._window_len = len(self.full_history)
+        self._token_total = self._system_tokens + sum(self._history_sizes)
+        self._messages = None
+    
+    def _append_message(self, message):
+        """Append a message to the history and the window"""
+        tokens = TokenCounter.count_message_tokens(message)
+        if self._window_len == self.history_limit:
+            # The oldest message in the window is about to be dropped
+            self._pop_oldest()
+        self.full_history.append(message)
+        self._history_sizes.append(tokens)
+        self._window_len += 1
+        self._token_total += tokens
+        self._messages = None
+    
+    def _pop_oldest(self):
+        """Slide the oldest message out of the window (it stays in the history)"""
+        index = -self._window_len
+        self._window_len -= 1
+        self._token_total -= self._history_sizes[index]
+        self._messages = None
+        return self.full_history[index]
+    
+    def get_messages(self):
+        """Return the system message and the messages in the window"""
+        if self._messages is None:
+            # Walk back from the newest message; deques can't be sliced
+            window = list(islice(reversed(self.full_history), self._window_len))
+            window.append(self._system)
+            window.reverse()
+            self._messages = window
+        return self._messages
+    
+    def get_message_count(self):
+        """Get the number of messages in the window"""
+        return self._window_len
+    
+    def clear(self):
+        """Empty the window; the full history is kept"""
+        self._window_len = 0
+        self._token_total = self._system_tokens
+        self._messages = None
     
     def add_message(self, role, content):
         """Add message and trim if needed"""
-        message = {"role": role, "content": content}
-        
-        # Add to full history
-        self.full_history.append(message)
-        
-        # Add to current messages
-        self.messages.append(message)
+        self._append_message({"role": role, "content": content})
         self.last_updated = time.time()
         
         # Trim if needed (always keep system message)
@@ -163,19 +515,19 @@ class WindowMemory(ConversationMemory):
     
     def _trim_to_window(self):
         """Trim messages to the window size"""
-        if len(self.messages) > self.window_size + 1:  # +1 for system message
+        if self._window_len > self.window_size:
             # Keep system message and last N messages
-            self.messages = [self.messages[0]] + self.messages[-(self.window_size):]
+            self._keep_last(self.window_size)
     
     def _trim_to_tokens(self):
         """Trim messages to stay under token limit"""
-        while self.get_token_count() > self.max_tokens and len(self.messages) > 2:  # Keep at least system + 1 message
+        while self.get_token_count() > self.max_tokens and self._window_len > 1:  # Keep at least system + 1 message
             # Remove oldest non-system message
-            self.messages.pop(1)
+            self._pop_oldest()
     
     def get_full_history(self):
         """Return the complete message history"""
-        return [{"role": "system", "content": self.system_message}] + self.full_history
+        return [self._system, *self.full_history]
 
 
 class SummaryMemory(ConversationMemory):
@@ -196,8 +548,15 @@ class SummaryMemory(ConversationMemory):
         self.active_window = active_window
         self.max_tokens = max_tokens
         self.api_key = api_key
+        # The shared session already sends the server's key; only a different
+        # key needs its own header
+        self._headers = None
+        if api_key and api_key != GROQ_API_KEY:
+            self._headers = {"Authorization": f"Bearer {api_key}"}
         self.summary = None
         self.summarized_count = 0
+        # (future, message count) of a summary being generated in the background
+        self._pending_summary = None
     
     def add_message(self, role, content):
         """Add message and summarize if needed"""
@@ -205,48 +564,72 @@ class SummaryMemory(ConversationMemory):
         super().add_message(role, content)
         
         # Check if we need to summarize
-        if self.get_token_count() > self.max_tokens:
-            self._create_summary()
+        if self.get_token_count() > self.max_tokens and self._pending_summary is None:
+            self._start_summary()
     
-    def _create_summary(self):
-        """Summarize older messages"""
+    def _start_summary(self):
+        """Start summarizing older messages on a background thread"""
         # Keep system message and active window
-        messages_to_summarize = self.messages[1:-self.active_window] if len(self.messages) > self.active_window + 1 else []
+        count = len(self._body) - self.active_window
         
-        if not messages_to_summarize:
+        if count <= 0:
             return
         
-        # Create conversation text for summary
-        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages_to_summarize])
+        # Create conversation text for summary, reading the oldest messages
+        # in place rather than copying them out first
+        conversation_text = "\n".join(
+            f"{msg['role']}: {msg['content']}" for msg in islice(self._body, count)
+        )
         
         # Get summary using the API
-        summary = self._generate_summary(conversation_text)
+        future = GROQ_EXECUTOR.submit(self._generate_summary, conversation_text)
+        self._pending_summary = (future, count)
+    
+    def finish_background_work(self, wait=True):
+        """
+        Swap a pending summary in for the messages it covers.
+        
+        Args:
+            wait (bool): Block until the summary is ready, for at most
+                SUMMARY_WAIT_TIMEOUT seconds; otherwise only apply it if it
+                has already finished
+        """
+        if self._pending_summary is None:
+            return
+        future, count = self._pending_summary
+        try:
+            summary = future.result(timeout=SUMMARY_WAIT_TIMEOUT if wait else 0)
+        except FutureTimeoutError:
+            # Still running: keep the full history for now and leave the
+            # summary pending, to be applied on a later call
+            return
+        self._pending_summary = None
         
         # Update summary count
-        self.summarized_count = len(messages_to_summarize)
+        self.summarized_count = count
         
-        # Replace summarized messages with summary
+        # Replace summarized messages with summary. Messages added since the
+        # summary started are newer than the ones it covers, so dropping the
+        # oldest count messages removes exactly the summarized ones.
         if summary:
             self.summary = summary
-            # Update messages to: [system, summary, active_window_messages]
-            self.messages = [
-                self.messages[0],  # System message
-                {"role": "system", "content": f"Previous conversation summary: {summary}"},
-                *self.messages[-self.active_window:]  # Active window
-            ]
+            # Update messages to: [system, summary, newer messages]
+            self._keep_last(len(self._body) - count)
+            summary_message = {"role": "system", "content": f"Previous conversation summary: {summary}"}
+            tokens = TokenCounter.count_message_tokens(summary_message)
+            self._body.appendleft(summary_message)
+            self._token_sizes.appendleft(tokens)
+            self._token_total += tokens
+            self._messages = None
+    
+    def _create_summary(self):
+        """Summarize older messages and wait for the result"""
+        self._start_summary()
+        self.finish_background_work()
     
     def _generate_summary(self, conversation_text):
         """Generate a summary of the conversation using the API"""
         try:
-            # API endpoint
-            url = "https://api.groq.com/openai/v1/chat/completions"
-            
-            # Request headers
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             # Request body
             data = {
                 "model": "llama3-8b-8192",  # Use smaller model for summaries
@@ -258,17 +641,8 @@ class SummaryMemory(ConversationMemory):
                 "max_tokens": 500
             }
             
-            # Send the request
-            response = requests.post(url, headers=headers, json=data)
-            
-            # Check if the request was successful
-            response.raise_for_status()
-            
-            # Parse the response
-            result = response.json()
-            
-            # Extract and return the generated summary
-            return result["choices"][0]["message"]["content"]
+            # Send the request and return the generated summary
+            return groq_completion(data, TokenCounter.estimate_tokens(conversation_text) + data["max_tokens"], headers=self._headers)
             
         except Exception as e:
             print(f"Error generating summary: {e}")
@@ -277,6 +651,8 @@ class SummaryMemory(ConversationMemory):
     def clear(self):
         """Clear all messages and summary"""
         super().clear()
+        # A summary still being generated covers messages that are gone now
+        self._pending_summary = None
         self.summary = None
         self.summarized_count = 0
 
@@ -305,24 +681,25 @@ class TokenWindowMemory(ConversationMemory):
         """Add message and trim older messages if token limit exceeded"""
         # Add the new message
         message = {"role": role, "content": content}
-        self.messages.append(message)
+        self._append_message(message)
         self.last_updated = time.time()
         
         # Trim if we exceed token limit
-        current_tokens = self.get_token_count()
-        
-        while current_tokens > self.max_tokens and len(self.messages) > 2:  # Keep system + at least 1 message
+        while self.get_token_count() > self.max_tokens and len(self._body) > 1:  # Keep system + at least 1 message
             # Remove oldest non-system message
-            removed_msg = self.messages.pop(1)
-            # Recalculate tokens
-            current_tokens = self.get_token_count()
+            self._pop_oldest()
 
 
 # Create a memory manager to handle different memory strategies
 class MemoryManager:
     def __init__(self, api_key):
-        self.sessions = {}
+        # Sessions idle for an hour are evicted, and at most 10,000 are kept,
+        # so abandoned (or auto-generated) session IDs don't pin memory forever
+        self.sessions = TTLCache(maxsize=10_000, ttl=3600)
         self.api_key = api_key
+        # Guards the sessions cache and the stats across request threads;
+        # TTLCache isn't thread-safe
+        self.lock = threading.RLock()
         # Store model-specific performance stats
         self.performance_stats = {
             "llama3-70b-8192": {"total_requests": 0, "avg_response_time": 0, "usage": {"requests": 0, "tokens": 0}},
@@ -343,61 +720,95 @@ class MemoryManager:
         Returns:
             ConversationMemory: The memory object
         """
-        if session_id not in self.sessions:
-            # Create new memory of the specified type
-            if memory_type == "window":
-                self.sessions[session_id] = WindowMemory(system_message=system_message)
-            elif memory_type == "summary":
-                self.sessions[session_id] = SummaryMemory(system_message=system_message, api_key=self.api_key)
-            elif memory_type == "token":
-                self.sessions[session_id] = TokenWindowMemory(system_message=system_message)
-            else:
-                # Default to window memory
-                self.sessions[session_id] = WindowMemory(system_message=system_message)
-        
-        return self.sessions[session_id]
+        with self.lock:
+            memory = self.sessions.get(session_id)
+            if memory is None:
+                # Create new memory of the specified type
+                if memory_type == "window":
+                    memory = WindowMemory(system_message=system_message)
+                elif memory_type == "summary":
+                    memory = SummaryMemory(system_message=system_message, api_key=self.api_key)
+                elif memory_type == "token":
+                    memory = TokenWindowMemory(system_message=system_message)
+                else:
+                    # Default to window memory
+                    memory = WindowMemory(system_message=system_message)
+            
+            # Storing the memory again on every access renews the session's TTL
+            self.sessions[session_id] = memory
+            return memory
+    
+    def find_memory(self, session_id):
+        """Get the memory object for an existing session, or None"""
+        with self.lock:
+            return self.sessions.get(session_id)
     
     def clear_memory(self, session_id):
         """Clear the memory for a session"""
-        if session_id in self.sessions:
-            self.sessions[session_id].clear()
+        memory = self.find_memory(session_id)
+        if memory is not None:
+            with memory.lock:
+                memory.clear()
     
     def delete_session(self, session_id):
         """Delete a session completely"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-    
-    def get_session_info(self):
-        """Get information about all active sessions"""
-        info = []
-        for session_id, memory in self.sessions.items():
-            info.append({
+        with self.lock:
+            self.sessions.pop(session_id, None)
+    
+    def get_session_info(self, limit=None):
+        """
+        Get information about active sessions, most recently updated first.
+        
+        Args:
+            limit (int): Only return this many sessions; all of them if None
+            
+        Returns:
+            list: One info dict per session
+        """
+        with self.lock:
+            sessions = list(self.sessions.items())
+        
+        def last_updated(item):
+            return item[1].last_updated
+        
+        if limit is None:
+            sessions.sort(key=last_updated, reverse=True)
+        else:
+            # Picking the top few is O(n log limit) rather than a full sort
+            sessions = heapq.nlargest(limit, sessions, key=last_updated)
+        
+        info = [None] * len(sessions)
+        for i, (session_id, memory) in enumerate(sessions):
+            info[i] = {
                 "session_id": session_id,
                 "memory_type": memory.__class__.__name__,
-                "message_count": len(memory.messages) - 1,  # Exclude system message
+                "message_count": memory.get_message_count(),
                 "token_count": memory.get_token_count(),
                 "created_at": memory.created_at,
                 "last_updated": memory.last_updated,
                 "model": memory.get_model()
-            })
+            }
         return info
     
     def update_performance_stats(self, model, response_time, tokens):
         """Update performance statistics for a model"""
-        if model in self.performance_stats:
-            stats = self.performance_stats[model]
-            stats["total_requests"] += 1
-            stats["usage"]["requests"] += 1
-            stats["usage"]["tokens"] += tokens
-            
-            # Update average response time
-            stats["avg_response_time"] = (
-                (stats["avg_response_time"] * (stats["total_requests"] - 1)) + response_time
-            ) / stats["total_requests"]
+        with self.lock:
+            if model in self.performance_stats:
+                stats = self.performance_stats[model]
+                stats["total_requests"] += 1
+                stats["usage"]["requests"] += 1
+                stats["usage"]["tokens"] += tokens
+                
+                # Update average response time
+                stats["avg_response_time"] = (
+                    (stats["avg_response_time"] * (stats["total_requests"] - 1)) + response_time
+                ) / stats["total_requests"]
     
     def get_performance_stats(self):
         """Get performance statistics for all models"""
-        return self.performance_stats
+        # A snapshot, so the response isn't built while other threads update it
+        with self.lock:
+            return copy.deepcopy(self.performance_stats)
 
 # Create a memory manager
 memory_manager = MemoryManager(GROQ_API_KEY)
@@ -421,7 +832,7 @@ def chat():
         start_time = time.time()
         
         # Get request data
-        data = request.json
+        data = request.get_json(cache=False, silent=True)
         
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -448,54 +859,39 @@ def chat():
         # Get or create memory for this session
         memory = memory_manager.get_memory(session_id, memory_type, system_message)
         
-        # Update model if specified
-        if model:
-            memory.set_model(model)
-        
-        # Add user message to memory
-        memory.add_message("user", message)
-        
-        # Get conversation messages for the API
-        messages = memory.get_messages()
+        # One turn per session at a time; other sessions run in parallel
+        with memory.lock:
+            # A summary started during the previous turn has normally
+            # finished by now; swap it in before this turn builds on it
+            memory.finish_background_work()
+            
+            # Update model if specified
+            if model:
+                memory.set_model(model)
         
-        # Use the model and parameters stored in memory
-        model = memory.get_model()
-        parameters = memory.get_parameters()
-        temperature = parameters.get('temperature', 0.7)
-        max_tokens = parameters.get('max_tokens', 1024)
-        top_p = parameters.get('top_p', 0.9)
-        frequency_penalty = parameters.get('frequency_penalty', 0.0)
-        presence_penalty = parameters.get('presence_penalty', 0.0)
-        
-        # Prepare API request to Groq
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        groq_data = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "top_p": top_p,
-            "frequency_penalty": frequency_penalty,
-            "presence_penalty": presence_penalty
-        }
+            # Add user message to memory
+            memory.add_message("user", message)
         
-        # Send request to Groq API
-        response = requests.post(url, headers=headers, json=groq_data)
-        response.raise_for_status()
-        result = response.json()
+            # Prepare API request to Groq from the model, parameters and
+            # messages stored in memory
+            groq_data = memory.get_request_body()
+            model = groq_data["model"]
+            max_tokens = groq_data["max_tokens"]
         
-        # Extract assistant's response
-        assistant_message = result["choices"][0]["message"]["content"]
+            # Send request to Groq API and get the assistant's response
+            assistant_message = groq_completion(groq_data, memory.get_token_count() + max_tokens)
+            
+            # A summary started by the user message ran alongside the call
+            # above; swap it in now if it's ready, otherwise next turn
+            memory.finish_background_work(wait=False)
         
-        # Add assistant response to memory
-        memory.add_message("assistant", assistant_message)
+            # Add assistant response to memory. A summary this starts runs in
+            # the background and doesn't hold up the response.
+            memory.add_message("assistant", assistant_message)
         
-        # Get token counts for information
-        token_count = memory.get_token_count()
+            # Get token counts for information
+            token_count = memory.get_token_count()
+            memory_size = memory.get_message_count()
         
         # Calculate response time
         response_time = time.time() - start_time
@@ -514,7 +910,7 @@ def chat():
             "model": model,
             "memory_type": memory_type,
             "token_count": token_count,
-            "memory_size": len(memory.messages) - 1,  # Exclude system message
+            "memory_size": memory_size,
             "response_time": response_time,
             "stats": {
                 "response_time": response_time,
@@ -540,7 +936,11 @@ def clear_conversation():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(cache=False, silent=True)
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
         session_id = data.get('session_id')
         
         if not session_id:
@@ -558,115 +958,152 @@ def clear_conversation():
 def get_sessions():
     """API endpoint to get information about active sessions."""
     try:
-        # Get session information
-        session_info = memory_manager.get_session_info()
+        # Optional cap on the number of sessions, most recently updated first
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 0:
+            return jsonify({"error": "limit must not be negative"}), 400
         
-        # Sort by last updated
-        session_info.sort(key=lambda x: x["last_updated"], reverse=True)
+        # Get session information
+        session_info = memory_manager.get_session_info(limit)
         
         return jsonify(session_info)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# The memory types, models and parameter ranges below never change, so their
+# JSON bodies are built once at import time
+
+@functools.lru_cache(maxsize=None)
+def _static_variants(body):
+    """ETag and gzipped copy of a static body, computed once per body"""
+    return hashlib.md5(body).hexdigest(), gzip.compress(body, compresslevel=9)
+
+def static_json_response(body):
+    """
+    Build a response for a pre-serialized, unchanging JSON body.
+    
+    Clients that accept gzip get a copy compressed once, up front, rather
+    than on every request. Clients may cache it for an hour and revalidate
+    with If-None-Match (answered with a 304).
+    """
+    etag, gzipped = _static_variants(body)
+    if "gzip" in request.accept_encodings:
+        response = Response(gzipped, mimetype="application/json")
+        # Flask-Compress leaves already-encoded responses alone
+        response.headers["Content-Encoding"] = "gzip"
+        etag += "-gzip"
+    else:
+        response = Response(body, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+MEMORY_TYPES = [
+    {
+        "id": "window",
+        "name": "Window Memory",
+        "description": "Keeps a fixed number of recent messages"
+    },
+    {
+        "id": "summary", 
+        "name": "Summary Memory",
+        "description": "Summarizes older messages to maintain context while saving tokens"
+    },
+    {
+        "id": "token",
+        "name": "Token Window",
+        "description": "Optimizes for maximum context within token limits"
+    }
+]
+MEMORY_TYPES_JSON = json_dumps(MEMORY_TYPES)
+
 @app.route('/api/memory-types', methods=['GET'])
 def get_memory_types():
     """API endpoint to get available memory types."""
-    memory_types = [
-        {
-            "id": "window",
-            "name": "Window Memory",
-            "description": "Keeps a fixed number of recent messages"
-        },
-        {
-            "id": "summary", 
-            "name": "Summary Memory",
-            "description": "Summarizes older messages to maintain context while saving tokens"
-        },
-        {
-            "id": "token",
-            "name": "Token Window",
-            "description": "Optimizes for maximum context within token limits"
-        }
-    ]
-    return jsonify(memory_types)
+    return static_json_response(MEMORY_TYPES_JSON)
+
+# Available models
+MODELS = [
+    {
+        "id": "llama3-70b-8192", 
+        "name": "Llama 3 (70B)", 
+        "context_length": 8192,
+        "strengths": ["High accuracy", "Complex reasoning", "Nuanced responses"]
+    },
+    {
+        "id": "llama3-8b-8192", 
+        "name": "Llama 3 (8B)", 
+        "context_length": 8192,
+        "strengths": ["Fast responses", "Good for simple tasks", "Low resource usage"]
+    },
+    {
+        "id": "mixtral-8x7b-32768", 
+        "name": "Mixtral 8x7B", 
+        "context_length": 32768,
+        "strengths": ["Very long context", "Good performance", "Diverse knowledge"]
+    },
+    {
+        "id": "gemma-7b-it", 
+        "name": "Gemma 7B", 
+        "context_length": 8192,
+        "strengths": ["Instruction-tuned", "Compact", "Good for general tasks"]
+    }
+]
+MODELS_JSON = json_dumps(MODELS)
+MODEL_IDS = frozenset(model["id"] for model in MODELS)
 
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """API endpoint to get available models."""
-    # Return list of available models
-    models = [
-        {
-            "id": "llama3-70b-8192", 
-            "name": "Llama 3 (70B)", 
-            "context_length": 8192,
-            "strengths": ["High accuracy", "Complex reasoning", "Nuanced responses"]
-        },
-        {
-            "id": "llama3-8b-8192", 
-            "name": "Llama 3 (8B)", 
-            "context_length": 8192,
-            "strengths": ["Fast responses", "Good for simple tasks", "Low resource usage"]
-        },
-        {
-            "id": "mixtral-8x7b-32768", 
-            "name": "Mixtral 8x7B", 
-            "context_length": 32768,
-            "strengths": ["Very long context", "Good performance", "Diverse knowledge"]
-        },
-        {
-            "id": "gemma-7b-it", 
-            "name": "Gemma 7B", 
-            "context_length": 8192,
-            "strengths": ["Instruction-tuned", "Compact", "Good for general tasks"]
-        }
-    ]
-    return jsonify(models)
+    return static_json_response(MODELS_JSON)
+
+# Parameter ranges, currently the same for every model
+# You can customize these ranges based on model capabilities
+PARAMETER_RANGES = {
+    "temperature": {
+        "min": 0.0,
+        "max": 2.0,
+        "default": 0.7,
+        "step": 0.1
+    },
+    "top_p": {
+        "min": 0.0,
+        "max": 1.0,
+        "default": 0.9,
+        "step": 0.05
+    },
+    "frequency_penalty": {
+        "min": 0.0,
+        "max": 2.0,
+        "default": 0.0,
+        "step": 0.1
+    },
+    "presence_penalty": {
+        "min": 0.0,
+        "max": 2.0,
+        "default": 0.0,
+        "step": 0.1
+    },
+    "max_tokens": {
+        "min": 10,
+        "max": 4096,
+        "default": 1024,
+        "step": 10
+    }
+}
+PARAMETER_RANGES_JSON = json_dumps(PARAMETER_RANGES)
 
 @app.route('/api/parameters', methods=['GET'])
 def get_parameters():
-    """API endpoint to get parameter ranges for a model."""
-    try:
-        model_id = request.args.get('model', 'llama3-70b-8192')
-        
-        # Define parameter ranges for all models
-        # You can customize these ranges based on model capabilities
-        parameter_ranges = {
-            "temperature": {
-                "min": 0.0,
-                "max": 2.0,
-                "default": 0.7,
-                "step": 0.1
-            },
-            "top_p": {
-                "min": 0.0,
-                "max": 1.0,
-                "default": 0.9,
-                "step": 0.05
-            },
-            "frequency_penalty": {
-                "min": 0.0,
-                "max": 2.0,
-                "default": 0.0,
-                "step": 0.1
-            },
-            "presence_penalty": {
-                "min": 0.0,
-                "max": 2.0,
-                "default": 0.0,
-                "step": 0.1
-            },
-            "max_tokens": {
-                "min": 10,
-                "max": 4096,
-                "default": 1024,
-                "step": 10
-            }
-        }
-        
-        return jsonify(parameter_ranges)
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """
+    API endpoint to get parameter ranges for a model.
+    
+    The optional ?model= argument is accepted for compatibility, but every
+    model shares the same ranges.
+    """
+    return static_json_response(PARAMETER_RANGES_JSON)
 
 # NEW ENDPOINTS FOR MODULE7.PY SUPPORT
 
@@ -682,7 +1119,11 @@ def change_model():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(cache=False, silent=True)
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
         session_id = data.get('session_id')
         model = data.get('model')
         
@@ -690,13 +1131,13 @@ def change_model():
             return jsonify({"error": "Missing session_id or model"}), 400
             
         # Get the memory for this session
-        if session_id not in memory_manager.sessions:
+        memory = memory_manager.find_memory(session_id)
+        if memory is None:
             return jsonify({"error": "Session not found"}), 404
-            
-        memory = memory_manager.sessions[session_id]
         
         # Update the model
-        memory.set_model(model)
+        with memory.lock:
+            memory.set_model(model)
         
         # Return success with current parameters
         return jsonify({
@@ -724,7 +1165,11 @@ def update_parameters():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(cache=False, silent=True)
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
         session_id = data.get('session_id')
         parameters = data.get('parameters', {})
         
@@ -732,13 +1177,13 @@ def update_parameters():
             return jsonify({"error": "Missing session_id"}), 400
             
         # Get the memory for this session
-        if session_id not in memory_manager.sessions:
+        memory = memory_manager.find_memory(session_id)
+        if memory is None:
             return jsonify({"error": "Session not found"}), 404
-            
-        memory = memory_manager.sessions[session_id]
         
         # Update parameters
-        memory.set_parameters(parameters)
+        with memory.lock:
+            memory.set_parameters(parameters)
         
         # Return success with current parameters
         return jsonify({
@@ -766,7 +1211,7 @@ def compare_models():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(cache=False, silent=True)
         
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -782,21 +1227,19 @@ def compare_models():
         if not models:
             return jsonify({"error": "No models provided"}), 400
         
+        # Only the known models, each at most once, so one request can't
+        # queue an unbounded number of Groq calls
+        if not isinstance(models, list) or not all(isinstance(model, str) and model in MODEL_IDS for model in models):
+            return jsonify({"error": "Unknown model; see /api/models"}), 400
+        if len(set(models)) != len(models):
+            return jsonify({"error": "Each model may be compared only once"}), 400
+        
         # Default parameters
         temperature = parameters.get('temperature', 0.7)
         max_tokens = parameters.get('max_tokens', 1024)
         
-        # URL for API calls
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Compare each model
-        results = []
-        
-        for model in models:
+        def compare_model(model):
+            """Run the prompt on one model and describe the result"""
             start_time = time.time()
             
             # Create messages array
@@ -814,13 +1257,8 @@ def compare_models():
             }
             
             try:
-                # Send request to Groq API
-                response = requests.post(url, headers=headers, json=groq_data)
-                response.raise_for_status()
-                result = response.json()
-                
-                # Extract assistant's response
-                assistant_message = result["choices"][0]["message"]["content"]
+                # Send request to Groq API and get the assistant's response
+                assistant_message = groq_completion(groq_data, TokenCounter.count_conversation_tokens(messages) + max_tokens)
                 
                 # Calculate time
                 response_time = time.time() - start_time
@@ -828,23 +1266,26 @@ def compare_models():
                 # Get token count (estimate)
                 token_count = TokenCounter.count_conversation_tokens(messages) + TokenCounter.estimate_tokens(assistant_message)
                 
-                # Add to results
-                results.append({
+                # Update performance stats
+                memory_manager.update_performance_stats(model, response_time, token_count)
+                
+                return {
                     "model": model,
                     "response": assistant_message,
                     "response_time": response_time,
                     "token_count": token_count
-                })
-                
-                # Update performance stats
-                memory_manager.update_performance_stats(model, response_time, token_count)
+                }
                 
             except Exception as e:
-                results.append({
+                return {
                     "model": model,
                     "error": str(e),
                     "response": "Error generating response"
-                })
+                }
+        
+        # Compare each model; the calls run concurrently, so the whole
+        # comparison takes about as long as the slowest model
+        results = list(COMPARE_EXECUTOR.map(compare_model, models))
         
         return jsonify({
             "prompt": prompt,
@@ -867,5 +1308,10 @@ def get_performance():
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    # Development server. In production run the app under gunicorn instead.
+    # Only a Procfile's web process receives traffic, so deploy module6 as
+    # the web process of its own app:
+    # web: gunicorn -w 1 -k gthread --threads 32 --timeout 120 -b 0.0.0.0:$PORT module6:app
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
     print(f"Starting Advanced Memory Chatbot API on port {port}...")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
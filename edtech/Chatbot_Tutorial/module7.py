@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import uuid
 import os
@@ -43,13 +44,55 @@ if "parameter_ranges" not in st.session_state:
 if "comparison_results" not in st.session_state:
     st.session_state.comparison_results = None
 
+# Connect and read timeouts for calls to the Flask backend. A comparison
+# waits for every model, so it gets as long as the server allows a request.
+API_TIMEOUT = (2, 60)
+COMPARE_TIMEOUT = (2, 120)
+
+class TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests sent without one."""
+    
+    def __init__(self, *args, timeout=API_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        # requests passes timeout=None when the caller didn't set one
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+@st.cache_resource
+def _api_session():
+    """Create one HTTP session shared by every rerun and user of the app"""
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    # Every request gets API_TIMEOUT unless it passes its own
+    adapter = TimeoutAdapter(pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=3600)
+def _load_models():
+    """Fetch available models from the API, cached for an hour like the server allows"""
+    response = _api_session().get(f"{API_URL}/api/models")
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=3600)
+def _load_parameter_ranges(model_id):
+    """Fetch parameter ranges for a model, cached for an hour like the server allows"""
+    response = _api_session().get(f"{API_URL}/api/parameters", params={"model": model_id})
+    response.raise_for_status()
+    return response.json()
+
 # Function to fetch available models from the API
 def fetch_models():
     """Fetch available models and their information from the API"""
     try:
-        response = requests.get(f"{API_URL}/api/models")
-        response.raise_for_status()
-        models_data = response.json()
+        # Failures aren't cached, so the next rerun tries the API again
+        models_data = _load_models()
         
         # Store full model info
         st.session_state.models_info = {model["id"]: model for model in models_data}
@@ -64,9 +107,7 @@ def fetch_models():
 def fetch_parameter_ranges(model_id):
     """Fetch parameter ranges for a specific model"""
     try:
-        response = requests.get(f"{API_URL}/api/parameters?model={model_id}")
-        response.raise_for_status()
-        st.session_state.parameter_ranges = response.json()
+        st.session_state.parameter_ranges = _load_parameter_ranges(model_id)
         
         # Initialize parameters with defaults if not set
         if not st.session_state.parameters:
@@ -95,7 +136,7 @@ def chat_with_api(message):
         
         # Send request to API
         with st.spinner("AI is thinking..."):
-            response = requests.post(f"{API_URL}/api/chat", json=data)
+            response = _api_session().post(f"{API_URL}/api/chat", json=data)
             response.raise_for_status()
             result = response.json()
         
@@ -118,7 +159,7 @@ def clear_conversation():
         }
         
         # Send request to API
-        response = requests.post(f"{API_URL}/api/clear", json=data)
+        response = _api_session().post(f"{API_URL}/api/clear", json=data)
         response.raise_for_status()
         
         # Clear local message history
@@ -138,7 +179,7 @@ def update_parameters():
         }
         
         # Send request to API
-        response = requests.post(f"{API_URL}/api/update-parameters", json=data)
+        response = _api_session().post(f"{API_URL}/api/update-parameters", json=data)
         response.raise_for_status()
         
     except Exception as e:
@@ -155,7 +196,7 @@ def change_model(new_model_id):
         }
         
         # Send request to API
-        response = requests.post(f"{API_URL}/api/change-model", json=data)
+        response = _api_session().post(f"{API_URL}/api/change-model", json=data)
         response.raise_for_status()
         
         # Update local model and parameters
@@ -183,7 +224,7 @@ def compare_models(prompt, models_to_compare, system_message, parameters):
         
         # Send request to API
         with st.spinner("Comparing models..."):
-            response = requests.post(f"{API_URL}/api/compare-models", json=data)
+            response = _api_session().post(f"{API_URL}/api/compare-models", json=data, timeout=COMPARE_TIMEOUT)
             response.raise_for_status()
             result = response.json()
         
@@ -198,7 +239,7 @@ def compare_models(prompt, models_to_compare, system_message, parameters):
 def get_performance_stats():
     """Get performance statistics for models"""
     try:
-        response = requests.get(f"{API_URL}/api/performance")
+        response = _api_session().get(f"{API_URL}/api/performance")
         response.raise_for_status()
         return response.json()
     except Exception as e: